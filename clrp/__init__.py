@@ -1,2 +1,5 @@
 from .clr import CLR1Parser
 from .lexer.regex import RegularExpression
+from .lexer.regexset import RegexSet
+from .lexer.stream import Stream
+from .lexer.cache import PatternCache, compile
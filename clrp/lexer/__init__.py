@@ -1 +1,4 @@
 from .regex import RegularExpression
+from .regexset import RegexSet
+from .stream import Stream
+from .cache import PatternCache, compile
@@ -0,0 +1,137 @@
+from array import array
+from .util import ClassMap, Match
+
+
+class AhoCorasick:
+    """An Aho-Corasick automaton matching any of a set of literals"""
+
+    def __init__(self, keywords):
+        self.keywords = frozenset(keywords)
+        # every letter of the keywords gets its own class; class 0
+        # is every other character (which always goes back to the root)
+        letters = sorted({ord(letter) for keyword in keywords
+                          for letter in keyword})
+        bounds = [0]
+        segments = [0]
+        for cls, letter in enumerate(letters, 1):
+            if bounds[-1] == letter:
+                segments[-1] = cls
+            else:
+                bounds.append(letter)
+                segments.append(cls)
+            bounds.append(letter + 1)
+            segments.append(0)
+        self.classmap = ClassMap(bounds, segments)
+        self.n_classes = n = len(letters) + 1
+
+        # the trie of the keywords; state 0 is the root
+        children = [{}]
+        # the length of the keyword ending in each state (0 if none)
+        self.output = array("i", [0])
+        for keyword in self.keywords:
+            state = 0
+            for cls in self.classmap.classify(keyword):
+                if cls not in children[state]:
+                    children[state][cls] = len(children)
+                    children.append({})
+                    self.output.append(0)
+                state = children[state][cls]
+            self.output[state] = len(keyword)
+
+        # the goto function with the failure links folded in, so that
+        # every state has a transition upon every class
+        self.table = array("i", [0]) * (len(children) * n)
+        self.fail = array("i", [0]) * len(children)
+        self.depth = array("i", [0]) * len(children)
+        for cls, child in children[0].items():
+            self.table[cls] = child
+            self.depth[child] = 1
+        # breadth first, so a state's failure state is always done first
+        queue = list(children[0].values())
+        for state in queue:
+            fail = self.fail[state]
+            # the longest keyword ending here is either the state's
+            # own, or the longest one ending in its failure state
+            if not self.output[state]:
+                self.output[state] = self.output[fail]
+            for cls in range(n):
+                child = children[state].get(cls)
+                if child is None:
+                    self.table[state * n + cls] = self.table[fail * n + cls]
+                else:
+                    self.table[state * n + cls] = child
+                    self.fail[child] = self.table[fail * n + cls]
+                    self.depth[child] = self.depth[state] + 1
+                    queue.append(child)
+
+    @property
+    def n_states(self):
+        return len(self.output)
+
+    @property
+    def nbytes(self):
+        return self.classmap.nbytes + sum(
+            len(values) * values.itemsize for values in
+            (self.table, self.fail, self.depth, self.output))
+
+    def findall(self, string):
+        return list(self.finditer(string))
+
+    def finditer(self, string):
+        classes = self.classmap.classify(string)
+        pos = 0
+        while True:
+            span = self.search_span(classes, pos)
+            if span is None:
+                return
+            yield Match(span, string[span[0]: span[1]])
+            pos = span[1]
+
+    def search_span(self, classes, pos):
+        # the span of the leftmost-longest keyword at or after 'pos'
+        table, output, depth, n = self.table, self.output, self.depth, self.n_classes
+        state = 0
+        span = None
+        for pos in range(pos, len(classes)):
+            state = table[state * n + classes[pos]]
+            length = output[state]
+            if length:
+                start = pos + 1 - length
+                if span is None or start <= span[0]:
+                    span = (start, pos + 1)
+            # every keyword still going on started 'depth' characters
+            # ago, so once that's after the match, nothing can beat it
+            if span is not None and pos + 1 - depth[state] > span[0]:
+                return span
+        return span
+
+    def shortest_span(self, classes, pos):
+        # the span of the keyword that ends first at or after 'pos' (the
+        # longest one if several end there), which is as far as it reads
+        table, output, n = self.table, self.output, self.n_classes
+        state = 0
+        for pos in range(pos, len(classes)):
+            state = table[state * n + classes[pos]]
+            if output[state]:
+                return (pos + 1 - output[state], pos + 1)
+        return None
+
+    def check(self, string):
+        return string in self.keywords
+
+    def endswith(self, string):
+        return string.endswith(tuple(self.keywords))
+
+    def dump(self):
+        dump = ""
+        for state in range(self.n_states):
+            outputs = f" (keyword of length {self.output[state]})" if self.output[state] else ""
+            dump += f"state {state}{outputs}:\n----------------\n"
+            dump += f"fail to state {self.fail[state]}\n"
+            row = state * self.n_classes
+            for cls in range(self.n_classes):
+                to_state = self.table[row + cls]
+                if self.depth[to_state] == self.depth[state] + 1:
+                    dump += f"goto state {to_state} upon class {cls}\n"
+            dump += "\n"
+        return dump[:-2]
@@ -1,4 +1,24 @@
-from .parser import Token
+from .util import merge_intervals, complement_intervals, positions
+
+# every node also works out the literals its matches are made of, so the
+# matcher can skip ahead with str.find: 'exact' is the one string the
+# node matches (or None), every match starts with 'prefix', ends with
+# 'suffix', and contains 'factor'
+
+
+def common_prefix(first, second):
+    i = 0
+    while i < min(len(first), len(second)) and first[i] == second[i]:
+        i += 1
+    return first[:i]
+
+
+def common_suffix(first, second):
+    return common_prefix(first[::-1], second[::-1])[::-1]
+
+
+def longest(*literals):
+    return max(literals, key=len)
 
 
 class Basic:
@@ -6,13 +26,17 @@ class Basic:
         self.value = value
         self.pos = pos
         self.nullable = False
-        self.firstpos = self.lastpos = {pos}
+        # positions are packed into bitmasks: bit 'pos' stands for 'pos'
+        self.firstpos = self.lastpos = 1 << pos
         self.children = {self}
         # will be expanded on by other nodes
-        self.followpos = set()
+        self.followpos = 0
+        # the code points matched at this position
+        self.intervals = ((ord(value.match), ord(value.match)),)
+        self.exact = self.prefix = self.suffix = self.factor = value.match
 
     def __str__(self):
-        return f"Basic(value=\"{self.value.match}\", nullable={self.nullable}, firstpos={self.firstpos}, lastpos={self.lastpos})"
+        return f"Basic(value=\"{self.value.match}\", nullable={self.nullable}, firstpos={positions(self.firstpos)}, lastpos={positions(self.lastpos)})"
 
 
 class Alt:
@@ -24,97 +48,83 @@ class Alt:
         self.lastpos = self.first.lastpos | self.second.lastpos
         self.children = self.first.children | self.second.children
 
+        if self.first.exact == self.second.exact:
+            self.exact = self.first.exact
+        else:
+            self.exact = None
+        self.prefix = common_prefix(self.first.prefix, self.second.prefix)
+        self.suffix = common_suffix(self.first.suffix, self.second.suffix)
+        self.factor = longest(
+            self.prefix, self.suffix, self.first.factor
+            if self.first.factor == self.second.factor else "")
+
     def __str__(self):
-        return f"Alt(nullable={self.nullable}, firstpos={self.firstpos}, lastpos={self.lastpos}, first={str(self.first)}, second={str(self.second)})"
+        return f"Alt(nullable={self.nullable}, firstpos={positions(self.firstpos)}, lastpos={positions(self.lastpos)}, first={str(self.first)}, second={str(self.second)})"
 
 
-class Wildcard:
-    def __init__(self, pos):
-        self.nullable = False
+class CharClass:
+    """A set of characters, matched at a single position"""
+
+    def __init__(self, intervals, pos):
         self.pos = pos
-        self.children = set()
-
-        self.alphabet = set()
-        self.basic_nodes = {}
-        self.firstpos = set()
-        self.lastpos = set()
-
-        for i in range(255):
-            node = Basic(
-                Token("CHAR", chr(i), "?"), self.pos)
-            self.basic_nodes[self.pos] = node
-            self.alphabet.add(chr(i))
-            self.pos += 1
-            self.firstpos |= node.firstpos
-            self.lastpos |= node.lastpos
-            self.children.add(node)
+        self.nullable = False
+        self.firstpos = self.lastpos = 1 << pos
+        self.children = {self}
+        self.followpos = 0
+        # sorted, non-overlapping (first, last) code point ranges
+        self.intervals = merge_intervals(intervals)
+        # a set of one character is as good as a literal
+        if len(self.intervals) == 1 and self.intervals[0][0] == self.intervals[0][1]:
+            self.exact = chr(self.intervals[0][0])
+        else:
+            self.exact = None
+        self.prefix = self.suffix = self.factor = self.exact or ""
 
     def __str__(self):
-        return f"Wildcard(nullable=False, firstpos={self.firstpos}, lastpos={self.lastpos})"
+        return f"{type(self).__name__}(intervals={self.intervals}, nullable=False, firstpos={positions(self.firstpos)}, lastpos={positions(self.lastpos)})"
 
 
-class PositiveSet:
-    def __init__(self, set_items, pos):
-        self.nullable = False
-        self.firstpos = set()
-        self.lastpos = set()
-        self.children = set()
+class Wildcard(CharClass):
+    def __init__(self, pos, last):
+        super().__init__([(0, last)], pos)
 
-        self.pos = pos
-        self.alphabet = set()
-        self.basic_nodes = {}
-
-        flatten = lambda *n: (e for a in n
-                              for e in (flatten(*a) if isinstance(a, list) else (a,)))
-        for node in list(flatten(set_items)):
-            if isinstance(node, tuple):
-                for i in range(ord(node[0].value.match), ord(node[1].value.match) + 1):
-                    char_node = Basic(Token("CHAR", chr(i), "?"), self.pos)
-                    self.basic_nodes[self.pos] = char_node
-                    self.alphabet.add(chr(i))
-                    self.pos += 1
-                    self.firstpos |= char_node.firstpos
-                    self.lastpos |= char_node.lastpos
-                    self.children.add(char_node)
-            else:
-                self.firstpos |= node.firstpos
-                self.lastpos |= node.lastpos
-                self.children.add(node)
 
-    def __str__(self):
-        return f"PositiveSet(nullable=False, firstpos={self.firstpos}, lastpos={self.lastpos})"
+def set_intervals(set_items):
+    # the code point ranges of the items of a set
+    intervals = []
+    flatten = lambda *n: (e for a in n
+                          for e in (flatten(*a) if isinstance(a, list) else (a,)))
+    for node in list(flatten(set_items)):
+        # the items are the CHAR tokens themselves
+        if isinstance(node, tuple):
+            intervals.append((ord(node[0].match), ord(node[1].match)))
+        else:
+            intervals.append((ord(node.match), ord(node.match)))
+    return intervals
 
 
-class NegativeSet:
+class PositiveSet(CharClass):
     def __init__(self, set_items, pos):
-        self.nullable = False
-        self.firstpos = set()
-        self.lastpos = set()
-        self.children = set()
+        super().__init__(set_intervals(set_items), pos)
 
-        self.pos = pos
-        self.alphabet = set()
-        self.basic_nodes = {}
-
-        flatten = lambda *n: (e for a in n
-                              for e in (flatten(*a) if isinstance(a, list) else (a,)))
-        for node in list(flatten(set_items)):
-            if isinstance(node, tuple):
-                for i in range(ord(node[0].value.match), ord(node[1].value.match) + 1):
-                    char_node = Basic(Token("CHAR", chr(i), "?"), self.pos)
-                    self.basic_nodes[self.pos] = char_node
-                    self.alphabet.add(chr(i))
-                    self.pos += 1
-                    self.firstpos |= char_node.firstpos
-                    self.lastpos |= char_node.lastpos
-                    self.children.add(char_node)
-            else:
-                self.firstpos |= node.firstpos
-                self.lastpos |= node.lastpos
-                self.children.add(node)
 
-    def __str__(self):
-        return f"PositiveSet(nullable=False, firstpos={self.firstpos}, lastpos={self.lastpos})"
+class NegativeSet(CharClass):
+    def __init__(self, set_items, pos, last):
+        # every code point up to 'last' that isn't in one of the
+        # items, as the gaps between them; never one per character
+        super().__init__(complement_intervals(set_intervals(set_items), last),
+                         pos)
+
+
+class End(CharClass):
+    """The end marker of a pattern, which matches no character"""
+
+    def __init__(self, pos, tag=0):
+        super().__init__([], pos)
+        # which pattern ends here (a RegexSet has one marker per pattern)
+        self.tag = tag
+        # nothing is consumed, so it adds nothing to the literals
+        self.exact = self.prefix = self.suffix = self.factor = ""
 
 
 class Concat:
@@ -126,12 +136,66 @@ class Concat:
         self.lastpos = self.first.lastpos | self.second.lastpos if self.second.nullable else self.second.lastpos
         self.children = self.first.children | self.second.children
 
-        for child in self.children:
-            if child.pos in self.first.lastpos:
+        # only the first node's children can be in its lastpos
+        for child in self.first.children:
+            if self.first.lastpos >> child.pos & 1:
                 child.followpos |= self.second.firstpos
 
+        first, second = self.first, self.second
+        if first.exact is not None and second.exact is not None:
+            self.exact = first.exact + second.exact
+        else:
+            self.exact = None
+        if first.exact is not None:
+            self.prefix = first.exact + second.prefix
+        else:
+            self.prefix = first.prefix
+        if second.exact is not None:
+            self.suffix = first.suffix + second.exact
+        else:
+            self.suffix = second.suffix
+        self.factor = longest(self.prefix, self.suffix, first.factor,
+                              second.factor, first.suffix + second.prefix)
+
+    def __str__(self):
+        return f"Concat(nullable={self.nullable}, firstpos={positions(self.firstpos)}, lastpos={positions(self.lastpos)}, first={str(self.first)}, second={str(self.second)})"
+
+
+class Group:
+    """A capturing group, which matches just like the node inside of it"""
+
+    def __init__(self, node):
+        self.node = node
+        # numbered by where it opens, once the whole pattern is parsed
+        self.index = None
+        self.nullable = node.nullable
+        self.firstpos = node.firstpos
+        self.lastpos = node.lastpos
+        self.children = node.children
+        self.exact = node.exact
+        self.prefix = node.prefix
+        self.suffix = node.suffix
+        self.factor = node.factor
+
     def __str__(self):
-        return f"Concat(nullable={self.nullable}, firstpos={self.firstpos}, lastpos={self.lastpos}, first={str(self.first)}, second={str(self.second)})"
+        return f"Group(index={self.index}, nullable={self.nullable}, firstpos={positions(self.firstpos)}, lastpos={positions(self.lastpos)}, node={str(self.node)})"
+
+
+def number_groups(node, count=0):
+    # number the groups under 'node' in the order they open (depth
+    # first, left to right), after the first 'count'; gives how many
+    # there are then
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Group):
+            count += 1
+            node.index = count
+        if hasattr(node, "node"):
+            stack.append(node.node)
+        elif hasattr(node, "first"):
+            stack += [node.second, node.first]
+    return count
 
 
 class ZeroOrMore:
@@ -142,11 +206,14 @@ class ZeroOrMore:
         self.lastpos = node.lastpos
         self.children = self.node.children
         for child in self.children:
-            if child.pos in self.lastpos:
+            if self.lastpos >> child.pos & 1:
                 child.followpos |= self.firstpos
+        # it may match nothing at all
+        self.exact = None
+        self.prefix = self.suffix = self.factor = ""
 
     def __str__(self):
-        return f"ZeroOrMore(nullable=True, firstpos={self.firstpos}, lastpos={self.lastpos}, node={str(self.node)})"
+        return f"ZeroOrMore(nullable=True, firstpos={positions(self.firstpos)}, lastpos={positions(self.lastpos)}, node={str(self.node)})"
 
 
 class OneOrMore:
@@ -157,11 +224,15 @@ class OneOrMore:
         self.lastpos = node.lastpos
         self.children = self.node.children
         for child in self.children:
-            if child.pos in self.lastpos:
+            if self.lastpos >> child.pos & 1:
                 child.followpos |= self.firstpos
+        self.exact = None
+        self.prefix = node.prefix
+        self.suffix = node.suffix
+        self.factor = node.factor
 
     def __str__(self):
-        return f"OneOrMore(nullable={self.nullable}, firstpos={self.firstpos}, lastpos={self.lastpos}, node={str(self.node)})"
+        return f"OneOrMore(nullable={self.nullable}, firstpos={positions(self.firstpos)}, lastpos={positions(self.lastpos)}, node={str(self.node)})"
 
 
 class ZeroOrOne:
@@ -171,6 +242,9 @@ class ZeroOrOne:
         self.firstpos = node.firstpos
         self.lastpos = node.lastpos
         self.children = self.node.children
+        # it may match nothing at all
+        self.exact = None
+        self.prefix = self.suffix = self.factor = ""
 
     def __str__(self):
-        return f"OneOrMore(nullable=True, firstpos={self.firstpos}, lastpos={self.lastpos}, node={str(self.node)})"
+        return f"OneOrMore(nullable=True, firstpos={positions(self.firstpos)}, lastpos={positions(self.lastpos)}, node={str(self.node)})"
@@ -0,0 +1,93 @@
+import os
+from collections import deque
+from concurrent.futures import (Executor, Future, ThreadPoolExecutor,
+                                ProcessPoolExecutor)
+from itertools import islice
+
+# the regex a worker process matches with, loaded from its compiled
+# bytes once, when the worker starts
+worker_regex = None
+
+
+def load_worker(cls, data):
+    global worker_regex
+    worker_regex = cls.from_bytes(data)
+
+
+def apply(regex, method, batch):
+    match = getattr(regex, method)
+    return [match(string) for string in batch]
+
+
+def call_in_worker(function, *args):
+    return function(worker_regex, *args)
+
+
+def start_pool(regex, executor, workers):
+    # the pool to shut down afterwards (None if it isn't ours), and a
+    # function that submits 'function(regex, *args)' to it; 'executor'
+    # is "serial", "thread", "process" or any concurrent.futures.Executor;
+    # threads each build a lazy dfa's states in a cache of their own, but
+    # processes would need its states up front
+    if regex.lazy and (executor == "process" or
+                       isinstance(executor, ProcessPoolExecutor)):
+        raise ValueError("a lazy dfa can't be sent to worker processes")
+    if executor == "serial":
+        def submit(function, *args):
+            future = Future()
+            future.set_result(function(regex, *args))
+            return future
+        return None, submit
+    if executor == "thread":
+        pool = ThreadPoolExecutor(workers)
+        return pool, lambda function, *args: pool.submit(function, regex, *args)
+    if executor == "process":
+        # the workers get the compiled tables once, rather than
+        # the regex being pickled along with every call
+        pool = ProcessPoolExecutor(workers, initializer=load_worker,
+                                   initargs=(type(regex), regex.to_bytes()))
+        return pool, lambda function, *args: pool.submit(call_in_worker,
+                                                         function, *args)
+    if isinstance(executor, Executor):
+        return None, lambda function, *args: executor.submit(function, regex,
+                                                             *args)
+    raise ValueError(f"unknown executor {executor!r}")
+
+
+def in_order(pool, futures, workers):
+    # the results of 'futures' (an iterable that submits them as it goes),
+    # in order; only a few per worker are submitted ahead of the
+    # consumer, so they stream out of however long an iterable
+    pending = deque()
+    try:
+        for future in futures:
+            pending.append(future)
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        if pool is not None:
+            pool.shutdown()
+
+
+def batches(strings, batch_size):
+    strings = iter(strings)
+    while True:
+        batch = list(islice(strings, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def map_batches(regex, method, strings, executor="serial", workers=None,
+                batch_size=1024):
+    # 'regex.method(string)' for every string, in order
+    workers = 1 if executor == "serial" else workers or os.cpu_count() or 1
+    pool, submit = start_pool(regex, executor, workers)
+    futures = (submit(apply, method, batch)
+               for batch in batches(strings, batch_size))
+    for results in in_order(pool, futures, workers):
+        yield from results
@@ -0,0 +1,118 @@
+import threading
+from collections import OrderedDict
+from .regex import RegularExpression
+
+
+class Pending:
+    """A compilation going on in another thread"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.regex = None
+        self.error = None
+
+    def finish(self, regex, error=None):
+        self.regex = regex
+        self.error = error
+        self.done.set()
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.regex
+
+
+class PatternCache:
+    """A thread-safe LRU cache of compiled regular expressions"""
+
+    def __init__(self, max_size=512, max_bytes=2 ** 26):
+        # the least recently used patterns are evicted once there are
+        # more than 'max_size', or they take up more than 'max_bytes'
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        # the compilations going on, so that each pattern is only
+        # compiled once however many threads ask for it at once
+        self.pending = {}
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def compile(self, pattern, **flags):
+        key = (type(pattern), pattern, tuple(sorted(flags.items())))
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                if entry[0].lazy:
+                    self.resize(key, entry)
+                return entry[0]
+            pending = self.pending.get(key)
+            compiling = pending is None
+            if compiling:
+                self.misses += 1
+                pending = self.pending[key] = Pending()
+            else:
+                # someone else is already compiling it
+                self.hits += 1
+        if not compiling:
+            return pending.wait()
+        try:
+            regex = RegularExpression(pattern, **flags)
+        except Exception as error:
+            with self.lock:
+                del self.pending[key]
+            pending.finish(None, error)
+            raise
+        with self.lock:
+            del self.pending[key]
+            self.add(key, regex)
+        pending.finish(regex)
+        return regex
+
+    def add(self, key, regex):
+        # a pattern bigger than the whole budget is never kept
+        nbytes = regex.nbytes
+        if nbytes > self.max_bytes:
+            return
+        self.entries[key] = (regex, nbytes)
+        self.nbytes += nbytes
+        self.evict()
+
+    def resize(self, key, entry):
+        # a lazy pattern is handed to every thread that asks for it, and
+        # each of them builds its states in a cache of its own, so its
+        # size is taken again whenever it's asked for
+        regex, old = entry
+        nbytes = regex.nbytes
+        self.entries[key] = (regex, nbytes)
+        self.nbytes += nbytes - old
+        self.evict()
+
+    def evict(self):
+        while len(self.entries) > self.max_size or self.nbytes > self.max_bytes:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.nbytes -= evicted
+            self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+
+# the cache 'compile' goes through
+cache = PatternCache()
+
+
+def compile(pattern, **flags):
+    # 'RegularExpression(pattern, **flags)', compiled only the
+    # first time it's asked for
+    return cache.compile(pattern, **flags)
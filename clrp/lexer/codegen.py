@@ -0,0 +1,204 @@
+TEMPLATE = r'''# +----------------------------------------+
+# | THIS CODE HAS BEEN GENERATED BY clrp   |
+# | DO NOT EDIT                            |
+# +----------------------------------------+
+from bisect import bisect_right
+
+# literals that every match starts with and contains
+PREFIX = {prefix!r}
+FACTOR = {factor!r}
+# 1 for the states that can never accept again, 2 for the
+# ones that accept whatever comes after them
+STOPS = {stops!r}
+
+
+# a regex match
+class Match:
+    def __init__(self, span, match):
+        self.span = span
+        self.match = match
+
+    def __repr__(self):
+        return f"<regex.Match <span={{self.span}}, match=\"{{self.match}}\">>"
+
+
+# maps code points to their character class
+class ClassMap(dict):
+    def __init__(self, bounds, segments):
+        super().__init__()
+        self.bounds = bounds
+        self.segments = segments
+
+    def __missing__(self, key):
+        cls = self.segments[bisect_right(self.bounds, key) - 1]
+        # only so many code points are remembered
+        if len(self) < {memo}:
+            self[key] = cls
+        return cls
+
+
+CLASSMAP = ClassMap({bounds}, {segments})
+
+
+def classify(string):
+{classify}
+
+
+def check(string):
+    if string[:len(PREFIX)] != PREFIX:
+        return False
+    state = {start}
+    if STOPS[state]:
+        return STOPS[state] == 2
+    for first in range(0, len(string), 4096):
+        for cls in classify(string[first:first + 4096]):
+{check}
+    return state in {accepting}
+
+
+def scan_end(string, classes, pos):
+    find = getattr(string, "find", None) if PREFIX else None
+    state = {scan_start}
+    while True:
+        if find:
+            pos = find(PREFIX, pos)
+            if pos < 0:
+                return None
+        while pos < len(classes):
+            cls = classes[pos]
+            pos += 1
+{scan}
+        else:
+            return None
+
+
+def viable_starts(classes, end, pos):
+    state = {prefix_start}
+    starts = []
+    for i in range(end - 1, pos - 1, -1):
+        cls = classes[i]
+{viable}
+    starts.reverse()
+    return starts
+
+
+def longest_end(classes, start, failed=None):
+    state = {start}
+    end = None
+    visited = []
+    for pos in range(start, len(classes)):
+        cls = classes[pos]
+{longest}
+        if failed is not None:
+            if (pos, state) in failed:
+                break
+            visited.append((pos, state))
+    if failed is not None:
+        failed.update(visited)
+    return end
+
+
+def reverse_start(classes, end, pos):
+    state = {reverse_start}
+    start = None
+    for i in range(end - 1, pos - 1, -1):
+        cls = classes[i]
+{reverse}
+    return start
+
+
+def search_span(string, classes, pos):
+    find = getattr(string, "find", None)
+    if find and len(FACTOR) > len(PREFIX) and find(FACTOR, pos) < 0:
+        return None
+    end = scan_end(string, classes, pos)
+    if end is None:
+        return None
+    starts = viable_starts(classes, end, pos)
+    failed = set()
+    for start in starts[:-1]:
+        longest = longest_end(classes, start, failed)
+        if longest is not None:
+            return start, longest
+    return starts[-1], longest_end(classes, starts[-1])
+
+
+def finditer(string):
+    classes = classify(string)
+    pos = 0
+    while True:
+        span = search_span(string, classes, pos)
+        if span is None:
+            return
+        start, end = span
+        yield Match(span, string[start:end])
+        pos = end
+
+
+def findall(string):
+    return list(finditer(string))
+
+
+def endswith(string):
+    classes = classify(string)
+    return reverse_start(classes, len(classes), 0) is not None
+'''
+
+
+def condition(columns):
+    # a test for 'cls' being any of 'columns' (which are sorted)
+    runs = []
+    for column in columns:
+        if runs and runs[-1][1] == column - 1:
+            runs[-1][1] = column
+        else:
+            runs.append([column, column])
+    if len(runs) > 3:
+        return f"cls in {{{', '.join(map(str, columns))}}}"
+    return " or ".join(f"cls == {first}" if first == last else
+                       f"{first} <= cls <= {last}" for first, last in runs)
+
+
+def make_branches(dfa, level, after):
+    # the transitions of every state of 'dfa', unrolled into nested ifs
+    # on 'state' and then on 'cls'; 'after(target)' gives the lines that
+    # go right after a jump to 'target'
+    def jump(target, indent):
+        return [f"{indent}state = {target}"] + [
+            indent + line for line in after(target)]
+
+    def state_lines(state, depth):
+        indent = "    " * depth
+        targets = {}
+        row = state * dfa.n_classes
+        for column in range(dfa.n_classes):
+            targets.setdefault(dfa.table[row + column], []).append(column)
+        # the jump taken upon the most columns needs no test
+        default = max(targets, key=lambda target: len(targets[target]))
+        lines = []
+        keyword = "if"
+        for target, columns in targets.items():
+            if target != default:
+                lines.append(f"{indent}{keyword} {condition(columns)}:")
+                lines += jump(target, indent + "    ")
+                keyword = "elif"
+        if not lines:
+            return jump(default, indent)
+        lines.append(f"{indent}else:")
+        return lines + jump(default, indent + "    ")
+
+    def tree(states, depth):
+        # a binary search over the state ids
+        if len(states) == 1:
+            return state_lines(states[0], depth)
+        mid = len(states) // 2
+        indent = "    " * depth
+        return ([f"{indent}if state < {states[mid]}:"] + tree(states[:mid], depth + 1) +
+                [f"{indent}else:"] + tree(states[mid:], depth + 1))
+
+    return "\n".join(tree(list(range(1, dfa.n_states)), level))
+
+
+def accepting(dfa):
+    states = [str(state) for state in range(dfa.n_states) if dfa.accept[state]]
+    return "{" + ", ".join(states) + "}" if states else "()"
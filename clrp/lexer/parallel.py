@@ -0,0 +1,152 @@
+import os
+from .batch import start_pool, in_order
+from .stream import Stream
+from .util import DFA, Match
+
+# a search restarts right after every match, so where the matches are
+# depends on everything before them, and a chunk's matches can't be found
+# from a mapping of states alone. instead, every chunk is searched as if
+# a search started fresh at its beginning; the real search soon restarts
+# at one of the same positions, and from there on they agree
+
+
+def chunk_matches(regex, text, offset, stop, final):
+    # the matches of a search starting fresh at 'offset' over 'text' (the
+    # input from 'offset' on, which goes on after it unless 'final'),
+    # for every restart before 'stop'. also gives the restarts, the last
+    # one being where what's known about the chunk ends
+    stream = Stream(regex)
+    matches = stream.feed(text)
+    if final:
+        matches += stream.close()
+    restarts = [offset]
+    spans = []
+    for match in matches:
+        if restarts[-1] >= stop:
+            break
+        spans.append(shifted(match, offset))
+        restarts.append(match.span[1] + offset)
+    if final and len(spans) == len(matches):
+        # the search is over, nothing else matches
+        restarts.append(offset + len(text))
+    return spans, restarts
+
+
+def shifted(match, offset):
+    # a match of a stream that started at 'offset', as the
+    # (first, last, pattern, groups) of the whole input
+    return (match.span[0] + offset, match.span[1] + offset, match.pattern,
+            tuple(group and (group[0] + offset, group[1] + offset)
+                  for group in match.span.groups))
+
+
+def sequential(regex, string, pos, size):
+    # the matches of the usual search from 'pos' on, the same way; the
+    # input is only classified 'size' characters at a time, as it's read
+    stream = Stream(regex)
+    for first in range(pos, len(string), size):
+        for match in stream.feed(piece(regex, string, first, first + size)):
+            yield shifted(match, pos)
+    for match in stream.close():
+        yield shifted(match, pos)
+
+
+def chunk_mapping(regex, text):
+    # the state each state of the anchored dfa ends up in over 'text';
+    # every state is run at once, and the ones that meet go on together
+    dfa = regex.dfa
+    table, n = dfa.table, dfa.n_classes
+    current = {state: [state] for state in range(1, dfa.n_states)}
+    for cls in regex.classify(text):
+        following = {}
+        for state, origins in current.items():
+            to_state = table[state * n + cls]
+            if to_state != DFA.DEAD:
+                following.setdefault(to_state, []).extend(origins)
+        current = following
+        if not current:
+            break
+    mapping = [DFA.DEAD] * dfa.n_states
+    for state, origins in current.items():
+        for origin in origins:
+            mapping[origin] = state
+    return mapping
+
+
+def chunks(string, workers, chunk_size, overlap):
+    # the (start, stop, end) of every chunk: it's in charge of the restarts
+    # from 'start' up to 'stop', and reads on up to 'end'
+    n = len(string)
+    chunk_size = chunk_size or max(-(-n // workers), 1)
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        yield start, stop, min(stop + overlap, n)
+
+
+def piece(regex, string, start, end):
+    # a memoryview can't be sent to a worker process
+    text = string[start:end]
+    return bytes(text) if regex.binary else text
+
+
+def finditer(regex, string, executor="process", workers=None, chunk_size=None,
+             overlap=2 ** 12):
+    if regex.literals is None and not regex.searches:
+        # the chunks are searched by streams, which need the dfas
+        yield from regex.finditer(string)
+        return
+    workers = 1 if executor == "serial" else workers or os.cpu_count() or 1
+    pool, submit = start_pool(regex, executor, workers)
+    bounds = list(chunks(string, workers, chunk_size, overlap))
+    futures = (submit(chunk_matches, piece(regex, string, start, end), start,
+                      stop, end == len(string))
+               for start, stop, end in bounds)
+    # the usual search, while it's not in step with the chunks
+    behind = None
+    pos = 0
+    for (start, stop, end), (spans, restarts) in zip(
+            bounds, in_order(pool, futures, workers)):
+        index = {restart: i for i, restart in enumerate(restarts)}
+        while pos < stop:
+            i = index.get(pos)
+            if i is not None and i < len(spans):
+                # caught up with the chunk's search
+                for first, last, pattern, groups in spans[i:]:
+                    yield Match((first, last), pattern=pattern, string=string,
+                                groups=groups)
+                pos = restarts[-1]
+                behind = None
+                if pos >= stop:
+                    break
+            # not (or no longer) in step with the chunk: go on
+            # one match further the usual way
+            if behind is None:
+                behind = sequential(regex, string, pos, stop - start)
+            found = next(behind, None)
+            if found is None:
+                return
+            first, last, pattern, groups = found
+            yield Match((first, last), pattern=pattern, string=string,
+                        groups=groups)
+            pos = last
+
+
+def check(regex, string, executor="process", workers=None, chunk_size=None):
+    # the anchored dfa is run over every chunk from every state, and
+    # the mappings are chained together from the initial state
+    if regex.literals is not None:
+        return regex.check(string)
+    if regex.lazy or regex.dfa is None:
+        raise ValueError("only a dfa built up front has fixed states to map")
+    if regex.rejects(string):
+        return False
+    workers = 1 if executor == "serial" else workers or os.cpu_count() or 1
+    pool, submit = start_pool(regex, executor, workers)
+    futures = (submit(chunk_mapping, piece(regex, string, start, stop))
+               for start, stop, _ in chunks(string, workers, chunk_size, 0))
+    state = regex.dfa.start
+    for mapping in in_order(pool, futures, workers):
+        state = mapping[state]
+        if state == DFA.DEAD:
+            return False
+    return bool(regex.dfa.accept[state])
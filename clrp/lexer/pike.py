@@ -0,0 +1,318 @@
+from .ast import (Basic, Alt, Concat, ZeroOrMore, OneOrMore, ZeroOrOne,
+                  CharClass, Group, End)
+
+
+class PikeVM:
+    """Runs the position automaton of a regex directly, without a DFA"""
+
+    # the active positions are kept as bitmasks, and only the set bits
+    # are ever visited, so every character costs at most one visit per
+    # position: O(n * m) for n characters and m positions, whatever the
+    # pattern. this is what the dfas cache the steps of
+
+    def __init__(self, regex):
+        self.regex = regex
+        # in bytes mode the input is bytes, not classes
+        self.byte_classes = regex.byte_classes
+
+    def run(self, classes, composition):
+        # the positions reached from 'composition' over all of 'classes'
+        follow, byte_classes = self.regex.follow, self.byte_classes
+        for cls in classes:
+            if byte_classes:
+                cls = byte_classes[cls]
+            composition = follow(composition, cls)
+            if not composition:
+                break
+        return composition
+
+    def scan(self, classes):
+        # the positions reached after every character, with every pattern
+        # started over at every character (as in 'scan_step'),
+        # OR-ed together at the end markers
+        regex = self.regex
+        follow, start_group, finals = regex.follow, regex.start_group, regex.finals
+        byte_classes = self.byte_classes
+        composition = start_group
+        found = 0
+        for cls in classes:
+            if byte_classes:
+                cls = byte_classes[cls]
+            composition = follow(composition, cls) | start_group
+            found |= composition & finals
+        return found
+
+    def shortest_end(self, classes, pos):
+        # where the first match at or after 'pos' to end does
+        regex = self.regex
+        follow, start_group, finals = regex.follow, regex.start_group, regex.finals
+        byte_classes = self.byte_classes
+        composition = start_group
+        for pos in range(pos, len(classes)):
+            cls = classes[pos]
+            if byte_classes:
+                cls = byte_classes[cls]
+            composition = follow(composition, cls)
+            if composition & finals:
+                return pos + 1
+            composition |= start_group
+        return None
+
+    def search_span(self, string, classes, pos):
+        # the threads are kept in groups by where they started, earliest
+        # first. a position reached from more than one start only stays in
+        # the earliest group: whatever it goes on to match, the earlier
+        # start is the leftmost one, so the later threads add nothing
+        regex = self.regex
+        follow, start_group, finals = regex.follow, regex.start_group, regex.finals
+        find = getattr(string, "find", None) if regex.prefix else None
+        byte_classes = self.byte_classes
+        groups = [start_group]
+        starts = [pos]
+        span = None
+        while pos < len(classes):
+            if find and span is None and groups == [start_group]:
+                # nothing but a match starting right here is going on,
+                # so it can skip to the next prefix
+                pos = find(regex.prefix, pos)
+                if pos < 0:
+                    return None
+                starts = [pos]
+            cls = classes[pos]
+            if byte_classes:
+                cls = byte_classes[cls]
+            seen = 0
+            kept_groups = []
+            kept_starts = []
+            for group, start in zip(groups, starts):
+                group = follow(group, cls) & ~seen
+                if group:
+                    seen |= group
+                    kept_groups.append(group)
+                    kept_starts.append(start)
+                    if group & finals:
+                        # the later groups can't give the leftmost match
+                        span = (start, pos + 1)
+                        break
+            pos += 1
+            if span is None and start_group & ~seen:
+                kept_groups.append(start_group & ~seen)
+                kept_starts.append(pos)
+            groups, starts = kept_groups, kept_starts
+            if not groups:
+                break
+        return span
+
+    def reverse_start(self, classes, end, pos):
+        # where the longest match ending at 'end' (and starting no earlier
+        # than 'pos') starts, running the reversed pattern
+        regex = self.regex
+        byte_classes = self.byte_classes
+        composition = regex.reverse_initial
+        start = None
+        for i in range(end - 1, pos - 1, -1):
+            cls = classes[i]
+            if byte_classes:
+                cls = byte_classes[cls]
+            composition = regex.reverse_step(composition, cls)
+            if composition & 1:
+                start = i
+            elif not composition:
+                break
+        return start
+
+
+# the instructions of a program, each one an (op, x, y) tuple: CHAR
+# moves on upon any of the classes in 'x', SPLIT goes on at both 'x' and
+# 'y' ('x' first), JMP goes on at 'x', SAVE puts the current position in
+# slot 'x', LOOP jumps to 'y' if nothing was matched since the position
+# in slot 'x' was saved, and MATCH is where pattern 'x' ends
+CHAR, SPLIT, JMP, SAVE, LOOP, MATCH = range(6)
+
+
+def operands(node, kind):
+    # the nodes joined by a chain of 'kind' nodes, left to right
+    found = []
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if type(node) is kind:
+            stack += [node.second, node.first]
+        else:
+            found.append(node)
+    return found
+
+
+class Program:
+    """A pattern as instructions, run to find the spans of its groups"""
+
+    # the instructions keep to the structure of the pattern, so unlike
+    # the positions they know which group every character goes in. they
+    # are only ever run over a span a dfa already matched, thread by
+    # thread in order of priority, so the groups come out as they would
+    # from a backtracking matcher but in O(n * m) time
+
+    def __init__(self, code, n_groups, n_slots, byte_classes=None):
+        self.code = code
+        self.n_groups = n_groups
+        # a start and an end for every group, then where the current
+        # iteration of every repetition started
+        self.n_slots = n_slots
+        self.byte_classes = byte_classes
+        # the repetitions (by slot) every instruction is inside of
+        self.loops = [()] * len(code)
+        marks = {}
+        for pc, (op, x, y) in enumerate(code):
+            if op == SAVE and x >= 2 * n_groups:
+                marks[x] = pc
+            elif op == LOOP:
+                for inside in range(marks[x], pc + 1):
+                    self.loops[inside] += (x,)
+
+    @classmethod
+    def compile(cls, ast, n_groups, position_classes, byte_classes=None):
+        code = []
+        slots = [2 * n_groups]
+
+        def repeat(node, exit_to):
+            # an iteration of 'node' that matches nothing ends the
+            # repetition (with the groups it set), or it would go on
+            # forever; 'exit_to' is where the jump out goes
+            slot = slots[0]
+            slots[0] += 1
+            code.append((SAVE, slot, 0))
+            emit(node)
+            loop = len(code)
+            code.append(None)
+            exit_to.append((loop, slot))
+
+        def emit(node):
+            if isinstance(node, End):
+                code.append((MATCH, node.tag, 0))
+            elif isinstance(node, (Basic, CharClass)):
+                code.append((CHAR, frozenset(position_classes[node.pos]), 0))
+            elif isinstance(node, Concat):
+                for operand in operands(node, Concat):
+                    emit(operand)
+            elif isinstance(node, Alt):
+                alternatives = operands(node, Alt)
+                jumps = []
+                for alternative in alternatives[:-1]:
+                    split = len(code)
+                    code.append(None)
+                    emit(alternative)
+                    jumps.append(len(code))
+                    code.append(None)
+                    code[split] = (SPLIT, split + 1, len(code))
+                emit(alternatives[-1])
+                for jump in jumps:
+                    code[jump] = (JMP, len(code), 0)
+            elif isinstance(node, ZeroOrMore):
+                split = len(code)
+                code.append(None)
+                loops = []
+                repeat(node.node, loops)
+                code.append((JMP, split, 0))
+                code[split] = (SPLIT, split + 1, len(code))
+                for loop, slot in loops:
+                    code[loop] = (LOOP, slot, len(code))
+            elif isinstance(node, OneOrMore):
+                start = len(code)
+                loops = []
+                repeat(node.node, loops)
+                code.append((SPLIT, start, len(code) + 1))
+                for loop, slot in loops:
+                    code[loop] = (LOOP, slot, len(code))
+            elif isinstance(node, ZeroOrOne):
+                split = len(code)
+                code.append(None)
+                emit(node.node)
+                code[split] = (SPLIT, split + 1, len(code))
+            elif isinstance(node, Group):
+                code.append((SAVE, 2 * node.index - 2, 0))
+                emit(node.node)
+                code.append((SAVE, 2 * node.index - 1, 0))
+
+        emit(ast)
+        return cls(code, n_groups, slots[0], byte_classes)
+
+    def saved_items(self):
+        # the instructions as ints, with the classes of every CHAR
+        # in a second array
+        ops = []
+        classes = []
+        for op, x, y in self.code:
+            if op == CHAR:
+                ops += [op, len(classes), len(x)]
+                classes += sorted(x)
+            else:
+                ops += [op, x, y]
+        return [self.n_groups, self.n_slots, ops, classes]
+
+    @classmethod
+    def restore(cls, items, byte_classes=None):
+        # takes what 'saved_items' gave off the front of 'items'
+        n_groups, n_slots, ops, classes = items[:4]
+        del items[:4]
+        code = []
+        for i in range(0, len(ops), 3):
+            op, x, y = ops[i: i + 3]
+            if op == CHAR:
+                x, y = frozenset(classes[x: x + y]), 0
+            code.append((op, x, y))
+        return cls(code, n_groups, n_slots, byte_classes)
+
+    def follow(self, threads, seen, pc, slots, pos):
+        # add the thread at 'pc' to 'threads', going through the jumps,
+        # splits and saves until it's at a CHAR or a MATCH. a thread
+        # that gets somewhere another one already got to at 'pos' has a
+        # lower priority, and would do just the same from there on, so
+        # it's dropped; what it does depends on the pc, and on which of
+        # the repetitions it's inside of have matched nothing so far
+        code, loops = self.code, self.loops
+        stack = [(pc, slots)]
+        while stack:
+            pc, slots = stack.pop()
+            op, x, y = code[pc]
+            key = pc
+            if loops[pc] and op != CHAR and op != MATCH:
+                key = (pc, tuple(slots[slot] == pos for slot in loops[pc]))
+            if key in seen:
+                continue
+            seen.add(key)
+            if op == JMP:
+                stack.append((x, slots))
+            elif op == SPLIT:
+                stack += [(y, slots), (x, slots)]
+            elif op == SAVE:
+                stack.append((pc + 1, slots[:x] + (pos,) + slots[x + 1:]))
+            elif op == LOOP:
+                stack.append((y if slots[x] == pos else pc + 1, slots))
+            else:
+                threads.append((pc, slots))
+
+    def captures(self, classes, start, end):
+        # the spans of the groups (None for the ones that didn't take
+        # part) in the match of 'classes[start:end]', which has to match
+        code, byte_classes = self.code, self.byte_classes
+        threads = []
+        self.follow(threads, set(), 0, (-1,) * self.n_slots, start)
+        for pos in range(start, end):
+            cls = classes[pos]
+            if byte_classes:
+                cls = byte_classes[cls]
+            following = []
+            seen = set()
+            for pc, slots in threads:
+                op, x, _ = code[pc]
+                if op == CHAR and cls in x:
+                    self.follow(following, seen, pc + 1, slots, pos + 1)
+            threads = following
+            if not threads:
+                break
+        for pc, slots in threads:
+            if code[pc][0] == MATCH:
+                return tuple(None if slots[i] < 0 or slots[i + 1] < 0 else
+                             (slots[i], slots[i + 1])
+                             for i in range(0, 2 * self.n_groups, 2))
+        return (None,) * self.n_groups
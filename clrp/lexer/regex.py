@@ -1,21 +1,68 @@
-from .parser import Lexer, Parser
+import sys
+import mmap
+import types
+from bisect import bisect_left
+from .parser import Lexer, Parser, Token
 from .ast import (Basic, Alt,
                   Concat, ZeroOrMore,
                   OneOrMore, ZeroOrOne,
                   Wildcard, PositiveSet,
-                  NegativeSet)
-from .util import State, Match
+                  CharClass, NegativeSet, End, Group, number_groups)
+from .util import (State, DFA, LazyDFA, ClassMap, Match, positions,
+                   TooManyStates)
+from .aho import AhoCorasick
+from .pike import PikeVM, Program
+from .serialize import pack, unpack, pack_dfa, unpack_dfa
+from .codegen import TEMPLATE, make_branches, accepting
+from .batch import map_batches
+from . import parallel, vectorized, utf8
+
+# the escaped characters that don't stand for themselves
+ESCAPES = {"s": " ", "r": "\r", "n": "\n"}
 
 
 class RegularExpression:
     """A regular expression"""
 
-    def __init__(self, regex):
+    # whether the dfas keep track of which pattern every state accepts
+    TAGGED = False
+    # what 'to_bytes' marks the compiled expression as
+    KIND = 0
+
+    def __init__(self, regex, minimize=True, lazy=False, cache_size=2 ** 20,
+                 reverse=True, aho_corasick=True, max_states=2 ** 13,
+                 max_bytes=2 ** 26, utf8=False):
         self.pos = 1
+        self.lazy = lazy
+        self.cache_size = cache_size
+        # a dfa that would outgrow 'max_states' states or 'max_bytes'
+        # bytes of tables isn't built, and whatever would use it is
+        # run by a pike vm instead
+        self.max_states = max_states
+        self.max_bytes = max_bytes
+        self.vm = None
+        # the groups are numbered within each pattern
+        self.n_groups = 0
+        self.program = None
         self.basic_nodes = {}
         self.states = []
-        self.alphabet = set()
         self.lexer = Lexer()
+        # a str pattern can also match utf-8 encoded bytes, every
+        # character becoming the byte sequences that encode it
+        self.utf8 = utf8
+        regex, self.binary = self.decode(regex)
+        # an alternation of plain literals ('foo|bar|baz') is matched
+        # by an aho-corasick automaton, and never parsed at all, so
+        # it has none of the dfas or literals the others have
+        self.literals = None
+        self.dfa = self.scan_dfa = self.prefix_dfa = self.reverse_dfa = None
+        self.prefix = self.factor = ""
+        self.classmap = None
+        if aho_corasick and not self.binary:
+            keywords = self.literal_alternatives(regex)
+            if keywords is not None:
+                self.literals = AhoCorasick(keywords)
+                return
         self.parser = Parser({
             "regex": self.regex,
             "alt": self.alt,
@@ -32,102 +79,894 @@ class RegularExpression:
             "char": self.char,
             "set_item": self.set_item,
             "set_items": self.set_items,
-            "positive_set": self.positive_set
+            "positive_set": self.positive_set,
+            "negative_set": self.negative_set
         })
-        self.ast = self.parser.parse(self.lexer.lex(f"({regex})#"))[0]
+        self.ast = self.parse(regex)
         # the initial state is the firstpos of the root of the
         # syntax tree (in this case, 'self.ast' is the root node)
         self.initial_state = State(self.ast.firstpos, 0)
-        # the location where '#' is marks the final state
-        # (the last node in basic nodes)
-        self.final_state = len(self.basic_nodes)
-        self.build_states()
-        self.states.sort()
+        # the positions of the end markers make up the final states
+        self.finals = 0
+        for i, node in self.basic_nodes.items():
+            if isinstance(node, End):
+                self.finals |= 1 << i
+        # literals that every match starts with and contains (the
+        # end markers don't add anything to them)
+        self.prefix = self.ast.prefix
+        self.factor = self.ast.factor
+        if self.binary:
+            self.prefix = self.prefix.encode("latin-1")
+            self.factor = self.factor.encode("latin-1")
+        self.build_classes()
+        # the groups are found by running a program over the
+        # span of a match, once the dfas found it
+        if self.n_groups:
+            self.program = Program.compile(self.ast, self.n_groups,
+                                           self.position_classes,
+                                           self.byte_classes)
+        # a search starts a match at every character, until something
+        # matches; the empty match is never reported
+        self.start_group = self.ast.firstpos & ~self.finals
+        self.build_precedepos()
+        # the empty match is never reported by the reverse either
+        self.reverse_initial = 0
+        for i in positions(self.finals):
+            self.reverse_initial |= self.precedepos[i]
+        self.reverse_initial &= ~1
+        # any position but an end marker can come right before the
+        # end of a prefix of a match
+        self.prefix_initial = 0
+        for i in self.basic_nodes:
+            self.prefix_initial |= 1 << i
+        self.prefix_initial &= ~self.finals
+        if lazy:
+            self.dfa = self.make_dfa(self.ast.firstpos, 0,
+                                     self.follow, self.accepts,
+                                     self.tags if self.TAGGED else None)
+        else:
+            try:
+                self.build_states()
+                self.states.sort()
+                if minimize:
+                    self.minimize_states()
+                self.compile_states()
+            except TooManyStates:
+                pass
+        self.states = self.initial_state = None
+        # a scan starts the pattern over at every character and never
+        # stops, so it sees where the first match to end does (and for
+        # a set, every pattern matching anywhere in the string)
+        self.scan_dfa = self.bounded_dfa(self.start_group, 0, self.scan_step,
+                                         self.accepts,
+                                         self.tags if self.TAGGED else None)
+        # the leftmost match starts before that end, with a prefix of
+        # it; the prefix dfa runs backwards from there to those starts
+        self.prefix_dfa = self.bounded_dfa(self.prefix_initial, 0,
+                                           self.reverse_step,
+                                           self.reverse_accepts)
+        # the reverse dfa runs backwards from the end of a match to
+        # its start, for 'search' and 'endswith'
+        if reverse:
+            self.reverse_dfa = self.bounded_dfa(self.reverse_initial, 0,
+                                                self.reverse_step,
+                                                self.reverse_accepts)
+        if (None in (self.dfa, self.scan_dfa, self.prefix_dfa) or
+                reverse and self.reverse_dfa is None):
+            self.vm = PikeVM(self)
+
+    def bounded_dfa(self, initial, dead, step, accepts, tags=None):
+        # 'make_dfa', or None if the dfa would go over its budget
+        try:
+            return self.make_dfa(initial, dead, step, accepts, tags)
+        except TooManyStates:
+            return None
+
+    @property
+    def searches(self):
+        # whether the dfas a search runs were all built
+        return None not in (self.dfa, self.scan_dfa, self.prefix_dfa)
+
+    @property
+    def state_budget(self):
+        # the most states any one dfa may have; a state takes up a table
+        # row of 4 byte ints, with a column for every class, or every
+        # byte value in bytes mode
+        columns = 256 if self.binary else len(self.classes)
+        return min(self.max_states, self.max_bytes // (4 * columns))
+
+    def decode(self, regex):
+        # a bytes pattern matches bytes-like objects; its code
+        # points are the byte values
+        if isinstance(regex, bytes):
+            if self.utf8:
+                raise ValueError("a utf-8 pattern has to be a str")
+            return regex.decode("latin-1"), True
+        return regex, self.utf8
+
+    def parse(self, regex):
+        return self.parse_pattern(regex, 0)
+
+    def parse_pattern(self, regex, tag):
+        # the pattern followed by its end marker, which gets the last
+        # position; reaching it means the pattern matched
+        node = self.parser.parse(self.lexer.lex(regex))[0]
+        self.n_groups = max(self.n_groups, number_groups(node))
+        end = End(self.pos, tag)
+        self.basic_nodes[self.pos] = end
+        self.pos += 1
+        return Concat(node, end)
+
+    def literal_alternatives(self, regex):
+        # the literals of a pattern made of nothing but literals and
+        # alternations (with at least one of them), or None
+        literals = [""]
+        escape = False
+        for token in self.lexer.lex(regex):
+            if token.tag == "CHAR":
+                literals[-1] += ESCAPES.get(token.match, token.match) if escape else token.match
+                escape = False
+            elif token.tag == "SLASH":
+                escape = True
+            elif token.tag == "ALT":
+                literals.append("")
+            else:
+                return None
+        # an empty alternative, or an escape with nothing after
+        # it, is left for the parser to reject
+        if len(literals) < 2 or "" in literals or escape:
+            return None
+        return literals
+
+    def make_dfa(self, initial, dead, step, accepts, tags=None):
+        if self.lazy:
+            if self.binary:
+                # the table has a column for every byte value, which
+                # goes to the step upon the class of the byte
+                classes = self.byte_classes
+                return LazyDFA(initial, dead,
+                               lambda key, byte: step(key, classes[byte]),
+                               accepts, len(classes), self.cache_size, tags)
+            # states are built while matching, and flushed
+            # whenever they outgrow 'cache_size' bytes
+            return LazyDFA(initial, dead, step, accepts, len(self.classes),
+                           self.cache_size, tags)
+        dfa = DFA.build(initial, dead, step, accepts, len(self.classes), tags,
+                        self.state_budget)
+        return dfa.by_bytes(self.byte_classes) if self.binary else dfa
+
+    def build_classes(self):
+        # cut the code points up at every interval boundary; all the
+        # code points of a segment are matched by the same positions
+        bounds = {0}
+        for node in self.basic_nodes.values():
+            for first, last in node.intervals:
+                bounds |= {first, last + 1}
+        bounds = sorted(bounds)
+        # the positions matching each segment, found by walking every
+        # interval over the segments it covers
+        masks = [0] * len(bounds)
+        for i, node in self.basic_nodes.items():
+            for first, last in node.intervals:
+                for segment in range(bisect_left(bounds, first),
+                                     bisect_left(bounds, last + 1)):
+                    masks[segment] |= 1 << i
+        # segments matched by exactly the same positions behave the
+        # same in every state, so they share one equivalence class
+        signatures = {0: 0}
+        # class 0 holds every code point that no position matches
+        self.classes = [[]]
+        segments = []
+        for first, end, signature in zip(bounds,
+                                          bounds[1:] + [sys.maxunicode + 1],
+                                          masks):
+            if signature not in signatures:
+                signatures[signature] = len(self.classes)
+                self.classes.append([])
+            cls = signatures[signature]
+            if cls:
+                self.classes[cls].append((first, end - 1))
+            segments.append(cls)
+        self.classmap = ClassMap(bounds, segments)
+        # index the positions matching each class, and the
+        # classes matched at each position
+        self.class_positions = list(signatures)
+        self.position_classes = {i: [] for i in self.basic_nodes}
+        for cls, signature in enumerate(self.class_positions):
+            for i in positions(signature):
+                self.position_classes[i].append(cls)
+        # in bytes mode the tables are indexed by the bytes themselves,
+        # so the input never has to be classified
+        self.byte_classes = None
+        if self.binary:
+            self.byte_classes = [self.classmap[byte] for byte in range(256)]
+
+    def classify(self, string):
+        if self.binary:
+            # any bytes-like object (bytes, bytearray, mmap...), without
+            # copying it; indexing it gives the byte values
+            return memoryview(string).cast("B")
+        return self.classmap.classify(string)
+
+    def classify_chunks(self, string, chunk_size=2 ** 12):
+        # the classes of 'string' a chunk at a time, for the loops that
+        # may stop early; bytes need no classifying to begin with
+        if self.binary:
+            yield self.classify(string)
+            return
+        for first in range(0, len(string), chunk_size):
+            yield self.classify(string[first: first + chunk_size])
+
+    def rejects(self, string):
+        # whether the literals alone show that 'string' doesn't match
+        # (a memoryview has no 'find', so the factor isn't looked for; an
+        # mmap finds from its current position unless told otherwise)
+        if string[:len(self.prefix)] != self.prefix:
+            return True
+        find = getattr(string, "find", None)
+        return find is not None and find(self.factor, 0) < 0
 
     def build_states(self):
-        state_id = 1
+        # every state by its composition, so that
+        # duplicates are found without a scan
+        built = {self.initial_state.composition: self.initial_state}
         unmarked_states = [self.initial_state]
         while unmarked_states:
             state = unmarked_states.pop()
             self.states.append(state)
-            for letter in self.alphabet:
-                # the composition of the new state
-                composition = set()
-                for i in state.composition:
-                    if self.basic_nodes[i].value.match == letter:
-                        composition |= self.basic_nodes[i].followpos
+            # the composition reached upon each class, going over
+            # every position of the state only once
+            compositions = {}
+            for i in positions(state.composition):
+                followpos = self.basic_nodes[i].followpos
+                for cls in self.position_classes[i]:
+                    compositions[cls] = compositions.get(cls, 0) | followpos
+            for cls, composition in sorted(compositions.items()):
                 if composition:
-                    new_state = State(composition, state_id)
+                    new_state = built.get(composition)
                     # we don't want duplicate states
-                    if new_state not in self.states:
+                    if new_state is None:
+                        if len(built) >= self.state_budget:
+                            raise TooManyStates(len(built))
+                        new_state = State(composition, len(built))
+                        built[composition] = new_state
                         unmarked_states.append(new_state)
-                        state_id += 1
+                    # add the transition upon 'cls' to the new state
+                    state.transitions[cls] = new_state
+
+    def follow(self, composition, cls):
+        follow = 0
+        # class 0 has no positions, so it never goes anywhere
+        for i in positions(composition & self.class_positions[cls]):
+            follow |= self.basic_nodes[i].followpos
+        return follow
+
+    def accepts(self, composition):
+        return composition & self.finals
+
+    def tags(self, composition):
+        # the ids of the patterns whose end markers are
+        # in 'composition', as a bitmask
+        tags = 0
+        for i in positions(composition & self.finals):
+            tags |= 1 << self.basic_nodes[i].tag
+        return tags
+
+    def scan_step(self, composition, cls):
+        # the positions of every match still going, whenever it started
+        return self.follow(composition, cls) | self.start_group
+
+    def build_precedepos(self):
+        # the followpos of the reversed pattern: the positions that can
+        # come right before each one. bit 0, which is no position, marks
+        # the beginning of the pattern (and is where the reverse accepts)
+        self.precedepos = {i: 0 for i in self.basic_nodes}
+        for i, node in self.basic_nodes.items():
+            for j in positions(node.followpos):
+                self.precedepos[j] |= 1 << i
+        for j in positions(self.ast.firstpos):
+            self.precedepos[j] |= 1
+
+    def reverse_step(self, composition, cls):
+        precede = 0
+        for i in positions(composition & self.class_positions[cls]):
+            precede |= self.precedepos[i]
+        return precede
+
+    def reverse_accepts(self, composition):
+        return composition & 1
+
+    def minimize_states(self):
+        # hopcroft's partition refinement: a missing transition
+        # goes to an implicit dead state (index 'dead'), which
+        # is just another non-accepting state while refining
+        dead = len(self.states)
+        index = {id(state): i for i, state in enumerate(self.states)}
+        # states start out apart by the end markers they have, so
+        # that only states accepting the same patterns are merged
+        by_finals = {0: {dead}}
+        for i, state in enumerate(self.states):
+            by_finals.setdefault(state.composition & self.finals, set()).add(i)
+
+        # inverse transitions: class -> target -> sources
+        classes = range(1, len(self.classes))
+        inverse = {cls: {} for cls in classes}
+        for i, state in enumerate(self.states + [None]):
+            for cls in classes:
+                to_state = state.transitions.get(cls) if state else None
+                target = index[id(to_state)] if to_state else dead
+                inverse[cls].setdefault(target, set()).add(i)
+
+        partition = list(by_finals.values())
+        block_of = {i: b for b, block in enumerate(partition) for i in block}
+        # every block but the largest one splits the others
+        largest = max(range(len(partition)), key=lambda b: len(partition[b]))
+        worklist = [b for b in range(len(partition)) if b != largest]
+        waiting = set(worklist)
+        while worklist:
+            splitter = worklist.pop()
+            waiting.discard(splitter)
+            # the splitter may itself be split below
+            splitter = list(partition[splitter])
+            for cls in classes:
+                # only the blocks with a source in them can be split
+                touched = {}
+                for target in splitter:
+                    for i in inverse[cls].get(target, ()):
+                        touched.setdefault(block_of[i], set()).add(i)
+                for b, inside in touched.items():
+                    block = partition[b]
+                    if len(inside) == len(block):
+                        continue
+                    # 'inside' moves to a new block, 'b' keeps the rest
+                    block -= inside
+                    new = len(partition)
+                    partition.append(inside)
+                    for i in inside:
+                        block_of[i] = new
+                    if b in waiting or len(inside) <= len(block):
+                        split = new
                     else:
-                        # if the state already is in 'self.states',
-                        # set 'new_state' to that states
-                        new_state = self.states[self.states.index(new_state)]
-                    # add the transition upon 'letter' to the new state
-                    state.transitions[letter] = new_state
+                        split = b
+                    worklist.append(split)
+                    waiting.add(split)
+
+        # every block that contains the dead state can never
+        # reach an accepting state, so it is dropped entirely
+        blocks = [block for block in partition if dead not in block]
+        # keep the block of the initial state first, so it gets id 0
+        blocks.sort(key=lambda block: 0 not in block)
+        block_of = {i: block_id
+                    for block_id, block in enumerate(blocks)
+                    for i in block}
+        minimized = []
+        for block_id, block in enumerate(blocks):
+            composition = 0
+            for i in block:
+                composition |= self.states[i].composition
+            minimized.append(State(composition, block_id))
+        for block_id, block in enumerate(blocks):
+            # any state in the block is a valid representative
+            representative = self.states[min(block)]
+            for cls, to_state in representative.transitions.items():
+                target = block_of.get(index[id(to_state)])
+                if target is not None:
+                    minimized[block_id].transitions[cls] = minimized[target]
+        if 0 not in block_of:
+            # the language is empty: a lone state that never accepts
+            minimized.insert(0, State(0, 0))
+        self.states = minimized
+        self.initial_state = self.states[0]
+
+    def compile_states(self):
+        self.dfa = DFA.from_states(self.states, self.initial_state,
+                                   self.finals, len(self.classes),
+                                   self.tags if self.TAGGED else None)
+        # 'check' stops as soon as the answer can't change any more;
+        # class 0 may have no characters (or bytes) left in it at all
+        if self.binary:
+            columns = sorted(set(self.byte_classes))
+        else:
+            columns = sorted({cls for first, cls in zip(self.classmap.bounds,
+                                                        self.classmap.segments)
+                              if first <= sys.maxunicode})
+        self.dfa.stop_states(columns)
+        if self.binary:
+            self.dfa = self.dfa.by_bytes(self.byte_classes)
+        # the matching loops only use the table, so the graph
+        # of 'State' objects is no longer needed
+        self.states = self.initial_state = None
+
+    @property
+    def nbytes(self):
+        # roughly the memory the compiled automata take up
+        if self.literals is not None:
+            return self.literals.nbytes
+        return self.classmap.nbytes + sum(
+            dfa.nbytes for dfa in (self.dfa, self.scan_dfa, self.prefix_dfa,
+                                   self.reverse_dfa) if dfa)
+
+    def to_bytes(self):
+        # the compiled automata, which 'from_bytes' loads without
+        # parsing the pattern or building any of them again
+        if self.lazy and self.literals is None:
+            raise ValueError("a lazy dfa can't be saved")
+        if self.vm is not None:
+            raise ValueError("a pattern run by the pike vm can't be saved")
+        return pack(self.KIND, self.saved_items())
+
+    @classmethod
+    def from_bytes(cls, buffer):
+        # 'buffer' may be any bytes-like object, the tables
+        # are used straight out of it
+        kind, items = unpack(buffer)
+        if kind != cls.KIND:
+            raise ValueError(f"not a compiled {cls.__name__}")
+        regex = cls.__new__(cls)
+        regex.restore(items)
+        return regex
+
+    def dump(self, path):
+        with open(path, "wb") as file:
+            file.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        # the file is mapped into memory rather than read
+        with open(path, "rb") as file:
+            return cls.from_bytes(mmap.mmap(file.fileno(), 0,
+                                            access=mmap.ACCESS_READ))
+
+    def codegen(self, out_file="regex.py"):
+        matcher = open(out_file, "w")
+        matcher.write(self.make_matcher())
+        matcher.close()
+
+    def specialize(self):
+        # the generated matcher as a module, without writing it out
+        module = types.ModuleType("matcher")
+        exec(compile(self.make_matcher(), "<clrp matcher>", "exec"),
+             module.__dict__)
+        return module
+
+    def make_matcher(self):
+        # the source of a module with 'check', 'findall', 'finditer' and
+        # 'endswith', the states of each dfa unrolled into branches
+        if self.literals is not None:
+            raise ValueError("literal alternatives use aho-corasick, which "
+                             "has no dfa to generate code from")
+        if self.lazy:
+            raise ValueError("a lazy dfa has no states to generate code from")
+        if self.vm is not None:
+            raise ValueError("a pattern run by the pike vm has no dfa to "
+                             "generate code from")
+        if self.reverse_dfa is None:
+            raise ValueError("reverse dfa required to generate code")
+        scan_start = self.scan_dfa.start
+        stops = self.dfa.stop_states()
+
+        def scan_after(target):
+            if target == DFA.DEAD:
+                return ["return None"]
+            if self.scan_dfa.accept[target]:
+                return ["return pos"]
+            if target == scan_start:
+                # back where it started, it can skip to the next prefix
+                return ["if find:", "    break"]
+            return []
+
+        def longest_after(target):
+            if stops[target] == 1:
+                return ["break"]
+            if stops[target] == 2:
+                return ["return len(classes)"]
+            if self.dfa.accept[target]:
+                return ["end = pos + 1", "visited = []"]
+            return []
+
+        def backwards(dfa, accepted):
+            # the lines after a jump of a dfa run backwards
+            return lambda target: (["break"] if target == DFA.DEAD else
+                                   [accepted] if dfa.accept[target] else [])
+
+        if self.binary:
+            classify = 'return memoryview(string).cast("B")'
+        elif self.classmap.n_classes <= 256:
+            classify = 'return string.translate(CLASSMAP).encode("latin-1")'
+        else:
+            classify = "return [ord(cls) for cls in string.translate(CLASSMAP)]"
+        return TEMPLATE.format(
+            prefix=self.prefix,
+            factor=self.factor,
+            bounds=list(self.classmap.bounds),
+            segments=list(self.classmap.segments),
+            memo=ClassMap.TABLE + ClassMap.MEMO,
+            classify="    " + classify,
+            start=self.dfa.start,
+            accepting=accepting(self.dfa),
+            stops=bytes(stops),
+            check=make_branches(self.dfa, 3, lambda target: [
+                f"return {stops[target] == 2}"] if stops[target] else []),
+            scan_start=scan_start,
+            scan=make_branches(self.scan_dfa, 3, scan_after),
+            prefix_start=self.prefix_dfa.start,
+            viable=make_branches(self.prefix_dfa, 2,
+                                 backwards(self.prefix_dfa, "starts.append(i)")),
+            longest=make_branches(self.dfa, 2, longest_after),
+            reverse_start=self.reverse_dfa.start,
+            reverse=make_branches(self.reverse_dfa, 2,
+                                  backwards(self.reverse_dfa, "start = i")))
+
+    def saved_items(self):
+        if self.literals is not None:
+            keywords = sorted(self.literals.keywords)
+            return [int(self.binary), 1, len(keywords)] + keywords
+        program = self.program.saved_items() if self.program else [0]
+        return ([int(self.binary), 0, self.prefix, self.factor,
+                 self.classmap.bounds, self.classmap.segments] +
+                pack_dfa(self.dfa) + pack_dfa(self.scan_dfa) +
+                pack_dfa(self.prefix_dfa) + pack_dfa(self.reverse_dfa) +
+                program)
+
+    def restore(self, items):
+        # takes what 'saved_items' gave off the front of 'items'
+        self.lazy = False
+        self.cache_size = 2 ** 20
+        self.states = self.initial_state = self.ast = self.vm = None
+        self.binary = bool(items.pop(0))
+        self.literals = None
+        self.n_groups = 0
+        self.program = None
+        self.dfa = self.scan_dfa = self.prefix_dfa = self.reverse_dfa = None
+        self.prefix = self.factor = ""
+        self.classmap = None
+        if items.pop(0):
+            n = items.pop(0)
+            self.literals = AhoCorasick(items[:n])
+            del items[:n]
+            return
+        self.prefix, self.factor, bounds, segments = items[:4]
+        del items[:4]
+        self.classmap = ClassMap(list(bounds), list(segments))
+        self.classes = [[] for _ in range(self.classmap.n_classes)]
+        for first, end, cls in zip(bounds, list(bounds[1:]) + [sys.maxunicode + 1],
+                                   segments):
+            if cls:
+                self.classes[cls].append((first, end - 1))
+        self.byte_classes = None
+        if self.binary:
+            self.byte_classes = [self.classmap[byte] for byte in range(256)]
+        self.dfa = unpack_dfa(items)
+        self.scan_dfa = unpack_dfa(items)
+        self.prefix_dfa = unpack_dfa(items)
+        self.reverse_dfa = unpack_dfa(items)
+        if items[0]:
+            self.program = Program.restore(items, self.byte_classes)
+            self.n_groups = self.program.n_groups
+        else:
+            items.pop(0)
 
     def findall(self, string):
-        state = self.initial_state
-        matches = []
-        last_pos = 0
-        for pos, char in enumerate(string, 1):
-            try:
-                state = state.transitions[char]
-            except KeyError:
-                if self.final_state in state.composition and last_pos != pos - 1:
-                    matches.append(Match((last_pos, pos - 1),
-                                         string[last_pos: pos - 1]))
-                state = self.initial_state
-                last_pos = pos
-        if self.final_state in state.composition and last_pos != pos:
-            matches.append(Match((last_pos, pos), string[last_pos: pos]))
-        return matches
+        return list(self.finditer(string))
 
     def finditer(self, string):
-        state = self.initial_state
-        last_pos = 0
-        for pos, char in enumerate(string, 1):
-            try:
-                state = state.transitions[char]
-            except KeyError:
-                if self.final_state in state.composition and last_pos != pos - 1:
-                    yield Match((last_pos, pos - 1), string[last_pos: pos - 1])
-                state = self.initial_state
-                last_pos = pos
-        if self.final_state in state.composition and last_pos != pos:
-            yield Match((last_pos, pos), string[last_pos: pos])
+        if self.literals is not None:
+            yield from self.literals.finditer(string)
+            return
+        classes = self.classify(string)
+        pos = 0
+        while True:
+            span = self.search_span(string, classes, pos)
+            if span is None:
+                return
+            # the text is only sliced out once it's asked for
+            yield Match(span, string=string,
+                        groups=self.captures(classes, *span))
+            pos = span[1]
 
-    def fullmatch(self, string):
-        state = self.initial_state
-        matches = []
-        for char in enumerate(string, 1):
-            try:
-                state = state.transitions[char]
-            except KeyError:
+    def count(self, string):
+        # the number of matches, without making any 'Match'
+        if self.literals is not None:
+            return sum(1 for _ in self.literals.finditer(string))
+        classes = self.classify(string)
+        pos = count = 0
+        while True:
+            span = self.search_span(string, classes, pos)
+            if span is None:
+                return count
+            count += 1
+            pos = span[1]
+
+    def check_many(self, strings, executor="serial", workers=None,
+                   batch_size=1024):
+        # 'check' every string, streaming the results out in order
+        return map_batches(self, "check", strings, executor, workers,
+                           batch_size)
+
+    def findall_many(self, strings, executor="serial", workers=None,
+                     batch_size=1024):
+        return map_batches(self, "findall", strings, executor, workers,
+                           batch_size)
+
+    def count_many(self, strings, executor="serial", workers=None,
+                   batch_size=1024):
+        return map_batches(self, "count", strings, executor, workers,
+                           batch_size)
+
+    def check_array(self, strings):
+        # 'check' for a whole column of strings at once, as a numpy
+        # array of booleans
+        return vectorized.check_array(self, strings)
+
+    def fullmatch_array(self, strings):
+        # the spans of the full matches, as a numpy array with
+        # (-1, -1) for the strings that don't match
+        return vectorized.fullmatch_array(self, strings)
+
+    def finditer_parallel(self, string, executor="process", workers=None,
+                          chunk_size=None, overlap=2 ** 12):
+        # the same matches as 'finditer', with the chunks of
+        # 'string' searched by 'workers' at once
+        return parallel.finditer(self, string, executor, workers, chunk_size,
+                                 overlap)
+
+    def findall_parallel(self, string, executor="process", workers=None,
+                         chunk_size=None, overlap=2 ** 12):
+        return list(self.finditer_parallel(string, executor, workers,
+                                           chunk_size, overlap))
+
+    def check_parallel(self, string, executor="process", workers=None,
+                       chunk_size=None):
+        return parallel.check(self, string, executor, workers, chunk_size)
+
+    def search_span(self, string, classes, pos):
+        # the span of the leftmost-longest match at or after 'pos'
+        find = getattr(string, "find", None)
+        if find and len(self.factor) > len(self.prefix) and find(self.factor, pos) < 0:
+            # every match contains the factor, so there are none left
+            return None
+        if not self.searches:
+            return self.vm.search_span(string, classes, pos)
+        end = self.scan_end(string, classes, pos)
+        if end is None:
+            return None
+        # the leftmost match is the first of the viable starts that
+        # matches at all; the last one always does, since the first
+        # match to end starts there or later
+        starts = self.viable_starts(classes, end, pos)
+        failed = set()
+        for start in starts[:-1]:
+            longest = self.longest_end(classes, start, failed)
+            if longest is not None:
+                return start, longest
+        return starts[-1], self.longest_end(classes, starts[-1])
+
+    def captures(self, classes, start, end):
+        # the spans of the groups of the match of 'classes[start:end]'
+        if self.program is None:
+            return ()
+        return self.program.captures(classes, start, end)
+
+    def scan_end(self, string, classes, pos):
+        # where the first match at or after 'pos' to end does
+        dfa = self.scan_dfa
+        table, accept, n = dfa.table, dfa.accept, dfa.n_classes
+        # when the scan is back in its initial state, any match still
+        # going might as well start right here, so it can skip to the
+        # next prefix
+        find = getattr(string, "find", None) if self.prefix else None
+        skip = dfa.start if find else None
+        state = dfa.start
+        while True:
+            if find:
+                pos = find(self.prefix, pos)
+                if pos < 0:
+                    return None
+            for pos in range(pos, len(classes)):
+                cls = classes[pos]
+                next_state = table[state * n + cls]
+                if next_state == DFA.UNKNOWN:
+                    next_state = dfa.transition(state, cls)
+                state = next_state
+                if accept[state]:
+                    return pos + 1
+                elif state == DFA.DEAD:
+                    return None
+                elif state == skip:
+                    pos += 1
+                    break
+            else:
                 return None
-        if self.final_state in state.composition:
-            matches.append(Match((0, len(string)), string))
-        return matches
+
+    def viable_starts(self, classes, end, pos):
+        # the starts from 'pos' on of the text up to 'end' that's
+        # a prefix of some match, in order
+        dfa = self.prefix_dfa
+        table, accept, n = dfa.table, dfa.accept, dfa.n_classes
+        state = dfa.start
+        starts = []
+        for i in range(end - 1, pos - 1, -1):
+            cls = classes[i]
+            next_state = table[state * n + cls]
+            if next_state == DFA.UNKNOWN:
+                next_state = dfa.transition(state, cls)
+            state = next_state
+            if accept[state]:
+                starts.append(i)
+            elif state == DFA.DEAD:
+                break
+        starts.reverse()
+        return starts
+
+    def longest_end(self, classes, start, failed=None):
+        # where the longest match starting at 'start' ends, or None.
+        # 'failed' holds the (flushes, position, state) triples that
+        # nothing after accepts, found by the calls before; it's shared
+        # by the starts of a search, so none of the text is run from
+        # the same state twice in vain
+        dfa = self.dfa
+        table, accept, n = dfa.table, dfa.accept, dfa.n_classes
+        stops = dfa.stops
+        flushes = dfa.flushes
+        state = dfa.start
+        end = None
+        visited = []
+        for pos in range(start, len(classes)):
+            cls = classes[pos]
+            next_state = table[state * n + cls]
+            if next_state == DFA.UNKNOWN:
+                # a flush renumbers the states
+                next_state = dfa.transition(state, cls)
+                flushes = dfa.flushes
+            state = next_state
+            if accept[state]:
+                end = pos + 1
+                if stops is not None and stops[state] == 2:
+                    # it accepts whatever comes after
+                    return len(classes)
+                visited = []
+            elif state == DFA.DEAD:
+                break
+            if failed is not None:
+                key = (flushes, pos, state)
+                if key in failed:
+                    break
+                visited.append(key)
+        if failed is not None:
+            failed.update(visited)
+        return end
+
+    def reverse_start(self, classes, end, pos):
+        # where the longest match ending at 'end' (and
+        # starting no earlier than 'pos') starts
+        dfa = self.reverse_dfa
+        table, accept, n = dfa.table, dfa.accept, dfa.n_classes
+        state = dfa.start
+        start = None
+        for i in range(end - 1, pos - 1, -1):
+            cls = classes[i]
+            next_state = table[state * n + cls]
+            if next_state == DFA.UNKNOWN:
+                next_state = dfa.transition(state, cls)
+            state = next_state
+            if accept[state]:
+                start = i
+            elif state == DFA.DEAD:
+                break
+        return start
+
+    def endswith(self, string):
+        # whether a (non-empty) suffix of 'string' matches
+        if self.literals is not None:
+            return self.literals.endswith(string)
+        classes = self.classify(string)
+        if self.reverse_dfa is not None:
+            return self.reverse_start(classes, len(classes), 0) is not None
+        if self.vm is not None:
+            return self.vm.reverse_start(classes, len(classes), 0) is not None
+        raise ValueError("reverse dfa required to match suffixes")
+
+    def fullmatch(self, string):
+        if not self.check(string):
+            return None
+        groups = ()
+        if self.program is not None:
+            groups = self.program.captures(self.classify(string), 0,
+                                           len(string))
+        return [Match((0, len(string)), string, groups=groups)]
 
     def check(self, string):
-        state = self.initial_state
-        for char in string:
-            try:
-                state = state.transitions[char]
-            except KeyError:
+        if self.literals is not None:
+            return self.literals.check(string)
+        if string[:len(self.prefix)] != self.prefix:
+            return False
+        if self.dfa is not None and not self.lazy:
+            # a complete dfa knows the states where the rest of the
+            # input can't change the answer any more, usually well
+            # before a search for the factor would have got through
+            # all of it, so the factor isn't looked for
+            table, n = self.dfa.table, self.dfa.n_classes
+            stops = self.dfa.stop_states()
+            state = self.dfa.start
+            if stops[state]:
+                return stops[state] == 2
+            for classes in self.classify_chunks(string):
+                for cls in classes:
+                    state = table[state * n + cls]
+                    if stops[state]:
+                        return stops[state] == 2
+            return bool(self.dfa.accept[state])
+        if self.rejects(string):
+            return False
+        if self.dfa is None:
+            composition = self.vm.run(self.classify(string), self.ast.firstpos)
+            return bool(composition & self.finals)
+        table, n = self.dfa.table, self.dfa.n_classes
+        state = self.dfa.start
+        for cls in self.classify(string):
+            next_state = table[state * n + cls]
+            if next_state == DFA.UNKNOWN:
+                next_state = self.dfa.transition(state, cls)
+            if next_state == DFA.DEAD:
                 return False
-        if self.final_state in state.composition:
-            return True
+            state = next_state
+        return bool(self.dfa.accept[state])
+
+    def is_match(self, string):
+        # whether anything in 'string' matches, stopping
+        # as soon as the first match ends
+        if self.literals is not None:
+            classes = self.literals.classmap.classify(string)
+            return self.literals.shortest_span(classes, 0) is not None
+        return self.shortest_end(string, self.classify(string), 0) is not None
+
+    def search(self, string):
+        # the match that ends first (and the longest one ending there),
+        # or None; unlike 'finditer' it never reads past that end
+        if self.literals is not None:
+            span = self.literals.shortest_span(
+                self.literals.classmap.classify(string), 0)
+            return span and Match(span, string=string)
+        classes = self.classify(string)
+        end = self.shortest_end(string, classes, 0)
+        if end is None:
+            return None
+        if self.reverse_dfa is not None:
+            start = self.reverse_start(classes, end, 0)
+        elif self.vm is not None:
+            start = self.vm.reverse_start(classes, end, 0)
+        else:
+            raise ValueError("reverse dfa required to find where a match starts")
+        pattern = None
+        if self.TAGGED:
+            pattern = self.fullmatches(string[start:end])[0]
+        return Match((start, end), pattern=pattern, string=string,
+                     groups=self.captures(classes, start, end))
+
+    def shortest_end(self, string, classes, pos):
+        # where the first match at or after 'pos' to end does
+        find = getattr(string, "find", None)
+        if find and len(self.factor) > len(self.prefix) and find(self.factor, pos) < 0:
+            return None
+        if self.scan_dfa is None:
+            return self.vm.shortest_end(classes, pos)
+        return self.scan_end(string, classes, pos)
 
     def dump_states(self):
-        dump = ""
-        for state in self.states:
-            dump += state.dump()
-            dump += "\n"
-        return dump[:-2]
+        if self.literals is not None:
+            return self.literals.dump()
+        if self.dfa is None:
+            raise ValueError("a pattern run by the pike vm has no states")
+        if self.binary:
+            # a column for every byte value
+            return self.dfa.dump([[repr(bytes([byte]))[2:-1]]
+                                  for byte in range(256)])
+        letters = [[
+            repr(chr(first))[1:-1] if first == last else
+            f"{repr(chr(first))[1:-1]}-{repr(chr(last))[1:-1]}"
+            for first, last in intervals
+        ] for intervals in self.classes]
+        return self.dfa.dump(letters)
 
     def regex(self, p):
         return p[0]
@@ -138,7 +977,41 @@ class RegularExpression:
     def reserved(self, p):
         return p[0]
 
+    def char_class(self, intervals):
+        char_class_node = CharClass(intervals, self.pos)
+        self.basic_nodes[self.pos] = char_class_node
+        self.pos += 1
+        return char_class_node
+
+    def utf8_node(self, intervals):
+        # the byte sequences encoding the code points of 'intervals',
+        # the ones starting with the same byte range sharing it
+        return self.byte_tree(utf8.sequences(intervals))
+
+    def byte_tree(self, sequences):
+        branches = {}
+        for sequence in sequences:
+            branches.setdefault(sequence[0], []).append(sequence[1:])
+        node = None
+        for first, rests in branches.items():
+            branch = self.char_class([first])
+            # a leading byte always comes with as many
+            # continuation bytes, so either all or none are empty
+            if rests[0]:
+                branch = Concat(branch, self.byte_tree(rests))
+            node = branch if node is None else Alt(node, branch)
+        # nothing to encode matches nothing at all
+        return node or self.char_class([])
+
     def atom(self, p):
+        if isinstance(p[0], Token):
+            if self.utf8 and ord(p[0].match) > 0x7F:
+                return self.utf8_node([(ord(p[0].match), ord(p[0].match))])
+            char_node = Basic(p[0], self.pos)
+            # will be used while building the dfa states
+            self.basic_nodes[self.pos] = char_node
+            self.pos += 1
+            return char_node
         return p[0]
 
     def alt(self, p):
@@ -157,21 +1030,25 @@ class RegularExpression:
         return ZeroOrOne(p[0])
 
     def group(self, p):
-        return p[1]
+        return Group(p[1])
+
+    def set_node(self, set_node):
+        # a set takes a single position, however many characters it
+        # has, unless it has to be matched as utf-8 byte sequences
+        if self.utf8 and set_node.intervals and set_node.intervals[-1][1] > 0x7F:
+            return self.utf8_node(set_node.intervals)
+        self.basic_nodes[self.pos] = set_node
+        self.pos += 1
+        return set_node
 
     def positive_set(self, p):
-        positive_set_node = PositiveSet(p[1], self.pos)
-        self.pos = positive_set_node.pos
-        self.alphabet |= positive_set_node.alphabet
-        self.basic_nodes.update(positive_set_node.basic_nodes)
-        return positive_set_node
+        return self.set_node(PositiveSet(p[1], self.pos))
 
     def negative_set(self, p):
-        negative_set_node = NegativeSet(p[1], self.pos)
-        self.pos = negative_set_node.pos
-        self.alphabet |= negative_set_node.alphabet
-        self.basic_nodes.update(negative_set_node.basic_nodes)
-        return negative_set_node
+        # the complement of the items, of every character
+        # (or every byte in bytes mode)
+        last = 0xFF if self.binary and not self.utf8 else sys.maxunicode
+        return self.set_node(NegativeSet(p[2], self.pos, last))
 
     def set_item(self, p):
         if len(p) == 3:
@@ -182,25 +1059,19 @@ class RegularExpression:
         return p
 
     def escape_char(self, p):
-        if p[1].match == "s":
-            p[1].match = " "
-        elif p[1].match == "r":
-            p[1].match = "\r"
-        elif p[1].match == "n":
-            p[1].match = "\n"
+        p[1].match = ESCAPES.get(p[1].match, p[1].match)
         return p[1]
 
     def wildcard(self, p):
-        wildcard_node = Wildcard(self.pos)
-        self.pos = wildcard_node.pos
-        self.alphabet |= wildcard_node.alphabet
-        self.basic_nodes.update(wildcard_node.basic_nodes)
+        if self.utf8:
+            return self.utf8_node([(0, sys.maxunicode)])
+        # any character, or any byte in bytes mode
+        wildcard_node = Wildcard(self.pos, 0xFF if self.binary else sys.maxunicode)
+        self.basic_nodes[self.pos] = wildcard_node
+        self.pos += 1
         return wildcard_node
 
     def char(self, p):
-        char_node = Basic(p[0], self.pos)
-        # will be used while building the dfa states
-        self.basic_nodes[self.pos] = char_node
-        self.alphabet.add(p[0].match)
-        self.pos += 1
-        return char_node
+        # a char only gets a position once it's used as an atom;
+        # inside of a set it stays a token
+        return p[0]
@@ -0,0 +1,92 @@
+from .regex import RegularExpression
+from .ast import Alt
+from .util import DFA, positions
+
+
+class RegexSet(RegularExpression):
+    """Many regular expressions, matched together in a single pass"""
+
+    TAGGED = True
+    KIND = 1
+
+    def __init__(self, patterns, minimize=True, lazy=False, cache_size=2 ** 20,
+                 reverse=True, max_states=2 ** 13, max_bytes=2 ** 26,
+                 utf8=False):
+        # the id of a pattern is its index in 'patterns'
+        if isinstance(patterns, (str, bytes)):
+            raise TypeError("a regex set takes a list of patterns, "
+                            "not a single one")
+        self.patterns = list(patterns)
+        if not self.patterns:
+            raise ValueError("a regex set needs at least one pattern")
+        super().__init__(self.patterns, minimize, lazy, cache_size, reverse,
+                         False, max_states, max_bytes, utf8)
+
+    def decode(self, patterns):
+        decoded = [RegularExpression.decode(self, pattern) for pattern in patterns]
+        if len({binary for _, binary in decoded}) > 1:
+            raise TypeError("can't mix str and bytes patterns")
+        return [pattern for pattern, _ in decoded], decoded[0][1]
+
+    def parse(self, patterns):
+        # every pattern gets an end marker of its own, tagged with its
+        # id, and they're all alternatives under one root
+        root = None
+        for tag, pattern in enumerate(patterns):
+            node = self.parse_pattern(pattern, tag)
+            root = node if root is None else Alt(root, node)
+        return root
+
+    def saved_items(self):
+        return super().saved_items() + [len(self.patterns)] + self.patterns
+
+    def restore(self, items):
+        super().restore(items)
+        n = items.pop(0)
+        self.patterns = items[:n]
+        del items[:n]
+
+    def matches(self, string):
+        # the ids of the patterns matching (a non-empty) part of 'string'
+        if self.scan_dfa is None:
+            return positions(self.tags(self.vm.scan(self.classify(string))))
+        dfa = self.scan_dfa
+        table, accept, tags, n = dfa.table, dfa.accept, dfa.tags, dfa.n_classes
+        everything = (1 << len(self.patterns)) - 1
+        found = 0
+        state = dfa.start
+        for cls in self.classify(string):
+            next_state = table[state * n + cls]
+            if next_state == DFA.UNKNOWN:
+                next_state = dfa.transition(state, cls)
+            state = next_state
+            if accept[state]:
+                found |= tags[state]
+                if found == everything:
+                    break
+        return positions(found)
+
+    def fullmatches(self, string):
+        # the ids of the patterns matching all of 'string'
+        if self.rejects(string):
+            return []
+        if self.dfa is None:
+            composition = self.vm.run(self.classify(string), self.ast.firstpos)
+            return positions(self.tags(composition))
+        table, n = self.dfa.table, self.dfa.n_classes
+        state = self.dfa.start
+        for cls in self.classify(string):
+            next_state = table[state * n + cls]
+            if next_state == DFA.UNKNOWN:
+                next_state = self.dfa.transition(state, cls)
+            if next_state == DFA.DEAD:
+                return []
+            state = next_state
+        return positions(self.dfa.tags[state])
+
+    def finditer(self, string):
+        # the leftmost-longest matches of any of the patterns, each one
+        # going to the first pattern that matches all of it
+        for match in super().finditer(string):
+            match.pattern = self.fullmatches(match.match)[0]
+            yield match
@@ -0,0 +1,101 @@
+import sys
+import struct
+from array import array
+from .util import DFA
+
+# the format starts with MAGIC and the version, then every item in turn:
+# a type byte (and 3 bytes of padding), its length in bytes, and then
+# the item itself padded to 4 bytes, so that the int arrays stay aligned
+# and can be used straight out of an mmap
+MAGIC = b"CLRP"
+VERSION = 5
+
+NONE = 0
+INT = 1
+STR = 2
+BYTES = 3
+INTS = 4
+
+HEADER = struct.Struct("<4sHH")
+ITEM = struct.Struct("<B3xI")
+INT64 = struct.Struct("<q")
+
+
+def pack(kind, items):
+    # 'items' may hold None, ints, strs, bytes and int arrays
+    chunks = [HEADER.pack(MAGIC, VERSION, kind)]
+    for item in items:
+        if item is None:
+            tag, data = NONE, b""
+        elif isinstance(item, int):
+            tag, data = INT, INT64.pack(item)
+        elif isinstance(item, str):
+            tag, data = STR, item.encode("utf-8")
+        elif isinstance(item, (bytes, bytearray)):
+            tag, data = BYTES, bytes(item)
+        else:
+            # stored as little endian 32 bit ints
+            ints = array("i", item)
+            if sys.byteorder == "big":
+                ints.byteswap()
+            tag, data = INTS, ints.tobytes()
+        chunks.append(ITEM.pack(tag, len(data)))
+        chunks.append(data + bytes(-len(data) % 4))
+    return b"".join(chunks)
+
+
+def unpack(buffer):
+    # the kind and the items of 'buffer', which is any bytes-like
+    # object; int arrays are memoryviews into it wherever possible
+    view = memoryview(buffer).cast("B")
+    magic, version, kind = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise ValueError("not a compiled regular expression")
+    if version != VERSION:
+        raise ValueError(f"unsupported format version {version}")
+    items = []
+    offset = HEADER.size
+    while offset < len(view):
+        tag, length = ITEM.unpack_from(view, offset)
+        offset += ITEM.size
+        data = view[offset: offset + length]
+        offset += length + -length % 4
+        if tag == NONE:
+            items.append(None)
+        elif tag == INT:
+            items.append(INT64.unpack(data)[0])
+        elif tag == STR:
+            items.append(str(data, "utf-8"))
+        elif tag == BYTES:
+            items.append(bytes(data))
+        elif sys.byteorder == "big":
+            ints = array("i", data)
+            ints.byteswap()
+            items.append(ints)
+        else:
+            items.append(data.cast("i"))
+    return kind, items
+
+
+def pack_dfa(dfa):
+    if dfa is None:
+        return [None]
+    # the tags may be bigger than an int, so they're written in hex
+    tags = None
+    if dfa.tags is not None:
+        tags = " ".join(format(tag, "x") for tag in dfa.tags)
+    stops = bytes(dfa.stops) if dfa.stops is not None else None
+    return [dfa.start, dfa.n_classes, dfa.table, bytes(dfa.accept), tags,
+            stops]
+
+
+def unpack_dfa(items):
+    # takes the items of a dfa off the front of 'items'
+    start = items.pop(0)
+    if start is None:
+        return None
+    n_classes, table, accept, tags, stops = items[:5]
+    del items[:5]
+    if tags is not None:
+        tags = [int(tag, 16) for tag in tags.split()]
+    return DFA(table, accept, start, n_classes, tags, stops)
@@ -0,0 +1,241 @@
+from .util import DFA, Match
+
+# the buffer is trimmed to the text the next match may start in once
+# it's this long, and again whenever it doubles
+TRIM = 2 ** 12
+
+
+class Stream:
+    """Finds the matches of a regular expression in a string fed in chunks"""
+
+    def __init__(self, regex):
+        if regex.literals is None and not regex.searches:
+            raise ValueError("a pattern run by the pike vm can't be streamed")
+        self.regex = regex
+        if regex.literals is not None:
+            self.classify = regex.literals.classmap.classify
+            self.search = self.search_literals
+            self.start = 0
+        else:
+            self.classify = regex.classify
+            self.search = self.search_states
+            self.start = regex.scan_dfa.start
+        # only the text that a match may still be taken from is kept;
+        # 'base' is the offset of its first character in the whole input
+        self.buffer = bytearray() if regex.binary else ""
+        self.classes = self.buffer if regex.binary else self.classify("")
+        self.base = 0
+        self.restart(0)
+
+    def restart(self, pos):
+        # a search goes on from 'pos' in 'state'. it scans for the first
+        # match to end, which the next match has to start from 'origin' on
+        # but before; then 'starts' are the viable starts up to that end,
+        # and 'span' the longest match found from the one at 'index' (as
+        # in 'search_span'), all of them offsets in the input
+        self.pos = self.origin = pos
+        self.state = self.start
+        # how often the dfa had flushed its states when 'state' was
+        # taken, since a lazy dfa numbers them anew every time
+        self.flushes = 0
+        self.starts = None
+        self.index = 0
+        self.span = None
+        self.visited = []
+        self.failed = set()
+        self.limit = TRIM
+
+    def trim(self, keep):
+        # drop the part of the buffer before 'keep', which
+        # nothing will be taken from any more
+        self.buffer = self.buffer[keep - self.base:]
+        # in bytes mode the bytes are the classes
+        if self.regex.binary:
+            self.classes = self.buffer
+        else:
+            self.classes = self.classes[keep - self.base:]
+        self.base = keep
+
+    def feed(self, chunk):
+        # the matches that are certain once 'chunk' is seen
+        self.buffer += chunk
+        if not self.regex.binary:
+            self.classes += self.classify(chunk)
+        return list(self.advance(False))
+
+    def close(self):
+        # the matches left once the input is over
+        return list(self.advance(True))
+
+    def scan(self, fileobj, chunk_size=2 ** 16):
+        # every match in a file, read 'chunk_size' characters at a time
+        while True:
+            chunk = fileobj.read(chunk_size)
+            if not chunk:
+                break
+            yield from self.feed(chunk)
+        yield from self.close()
+
+    def advance(self, final):
+        while True:
+            span = self.search(final)
+            if span is None:
+                return
+            match = self.buffer[span[0] - self.base: span[1] - self.base]
+            if self.regex.binary:
+                match = bytes(match)
+            pattern = self.regex.fullmatches(match)[0] if self.regex.TAGGED else None
+            groups = ()
+            if self.regex.program is not None:
+                # in the buffer's own positions, which start at 'base'
+                groups = tuple(
+                    group and (group[0] + self.base, group[1] + self.base)
+                    for group in self.regex.program.captures(
+                        self.classes, span[0] - self.base, span[1] - self.base))
+            yield Match(span, match, pattern, groups=groups)
+            # the next search starts right after the match, going over
+            # whatever was read past it again
+            self.restart(span[1])
+
+    def search_states(self, final):
+        # 'search_span', picking up where the last chunk left off; it gives
+        # the next match, or None if there's none (yet, unless 'final')
+        if self.starts is None:
+            end = self.first_end(final)
+            if end is None:
+                return None
+            starts = self.regex.viable_starts(self.classes, end - self.base,
+                                              self.origin - self.base)
+            self.starts = [self.base + start for start in starts]
+            self.state = self.regex.dfa.start
+            self.pos = self.starts[0]
+            self.flushes = self.regex.dfa.flushes
+        return self.longest(final)
+
+    def first_end(self, final):
+        # 'scan_end' over what's been read so far
+        regex = self.regex
+        dfa = regex.scan_dfa
+        table, accept, n = dfa.table, dfa.accept, dfa.n_classes
+        prefix = regex.prefix
+        skip = dfa.start if prefix else None
+        classes, base = self.classes, self.base
+        state = self.state
+        pos = self.pos - base
+        if state != self.start and dfa.flushes != self.flushes:
+            # something else matched with the same lazy dfa in between,
+            # and 'state' is gone: scan again from where the match may start
+            state, pos = self.start, self.origin - base
+        while True:
+            if state == skip:
+                found = self.buffer.find(prefix, pos)
+                if found < 0:
+                    # a prefix may still start in the last few characters
+                    pos = max(pos, len(classes) - len(prefix) + 1)
+                    break
+                pos = found
+            for pos in range(pos, len(classes)):
+                cls = classes[pos]
+                next_state = table[state * n + cls]
+                if next_state == DFA.UNKNOWN:
+                    next_state = dfa.transition(state, cls)
+                state = next_state
+                if accept[state]:
+                    return base + pos + 1
+                elif state == DFA.DEAD:
+                    return None
+                elif state == skip:
+                    pos += 1
+                    break
+            else:
+                pos = len(classes)
+                break
+        if final:
+            return None
+        self.pos = base + pos
+        self.state = state
+        self.flushes = dfa.flushes
+        if len(classes) - (self.origin - base) >= self.limit:
+            # the next match can only start where the text read so far
+            # is a prefix of a match (or where the scan hasn't got to)
+            starts = regex.viable_starts(classes, len(classes),
+                                         self.origin - base)
+            self.origin = min(self.pos, base + (starts[0] if starts
+                                                else len(classes)))
+            self.trim(self.origin)
+            self.limit = max(TRIM, 2 * (len(self.classes) -
+                                        (self.origin - self.base)))
+        return None
+
+    def longest(self, final):
+        # 'longest_end' from every viable start in turn, until
+        # one of them matches
+        dfa = self.regex.dfa
+        table, accept, n = dfa.table, dfa.accept, dfa.n_classes
+        classes, base = self.classes, self.base
+        failed = self.failed
+        while True:
+            start = self.starts[self.index]
+            if self.state != dfa.start and dfa.flushes != self.flushes:
+                # the same, going over the match from its start again
+                self.state, self.pos = dfa.start, start
+                self.span, self.visited = None, []
+            state, span, visited = self.state, self.span, self.visited
+            flushes = dfa.flushes
+            for pos in range(self.pos - base, len(classes)):
+                cls = classes[pos]
+                next_state = table[state * n + cls]
+                if next_state == DFA.UNKNOWN:
+                    next_state = dfa.transition(state, cls)
+                    flushes = dfa.flushes
+                state = next_state
+                if accept[state]:
+                    span = (start, base + pos + 1)
+                elif state == DFA.DEAD:
+                    break
+                key = (flushes, base + pos, state)
+                if key in failed:
+                    break
+                if span is None:
+                    visited.append(key)
+            else:
+                if not final:
+                    # the match may go on in the next chunk
+                    self.state, self.span = state, span
+                    self.pos = base + len(classes)
+                    self.flushes = dfa.flushes
+                    self.trim(start)
+                    return None
+            if span is not None:
+                return span
+            # nothing matches from this start, try the next one
+            failed.update(visited)
+            self.index += 1
+            self.state = dfa.start
+            self.pos = self.starts[self.index]
+            self.span = None
+            self.visited = []
+
+    def search_literals(self, final):
+        # the same for an aho-corasick automaton, where the earliest
+        # keyword still going started 'depth' characters ago
+        literals = self.regex.literals
+        table, output, depth, n = (literals.table, literals.output,
+                                   literals.depth, literals.n_classes)
+        classes, base = self.classes, self.base
+        state, span = self.state, self.span
+        for pos in range(self.pos - base, len(classes)):
+            state = table[state * n + classes[pos]]
+            length = output[state]
+            if length:
+                start = base + pos + 1 - length
+                if span is None or start <= span[0]:
+                    span = (start, base + pos + 1)
+            if span is not None and base + pos + 1 - depth[state] > span[0]:
+                return span
+        if final:
+            return span
+        end = base + len(classes)
+        self.pos, self.state, self.span = end, state, span
+        self.trim(min([end - depth[state]] + ([span[0]] if span else [])))
+        return None
@@ -0,0 +1,64 @@
+import sys
+
+# a code point range is matched in utf-8 by a few sequences of byte
+# ranges, found by splitting it up the way re2 does: first where the
+# encoded length changes, then wherever the continuation bytes of its
+# two ends don't span their whole range (0x80-0xbf), until every byte
+# can vary on its own
+
+# the last code point of every encoded length
+LENGTHS = (0x7F, 0x7FF, 0xFFFF)
+SURROGATES = (0xD800, 0xDFFF)
+
+
+def without_surrogates(intervals):
+    # the surrogates have no utf-8 encoding
+    for first, last in intervals:
+        if first < SURROGATES[0] and last > SURROGATES[1]:
+            yield first, SURROGATES[0] - 1
+            yield SURROGATES[1] + 1, last
+        elif first < SURROGATES[0]:
+            yield first, min(last, SURROGATES[0] - 1)
+        elif last > SURROGATES[1]:
+            yield max(first, SURROGATES[1] + 1), last
+
+
+def sequences(intervals):
+    # the byte range sequences matching the code points of 'intervals',
+    # in order; every one is a list of (first, last) byte ranges
+    found = []
+    stack = [interval for interval in
+             without_surrogates(intervals) if interval[0] <= sys.maxunicode]
+    stack.reverse()
+    while stack:
+        first, last = stack.pop()
+        last = min(last, sys.maxunicode)
+        if first > last:
+            continue
+        split = split_range(first, last)
+        if split is not None:
+            # the lower half goes first
+            stack += [(split + 1, last), (first, split)]
+            continue
+        found.append(list(zip(chr(first).encode("utf-8"),
+                              chr(last).encode("utf-8"))))
+    return found
+
+
+def split_range(first, last):
+    # where 'first'-'last' has to be split before its bytes can be
+    # matched one range at a time, or None
+    for end in LENGTHS:
+        if first <= end < last:
+            return end
+    if last <= 0x7F:
+        return None
+    for i in range(1, len(chr(last).encode("utf-8"))):
+        # the bits of the last 'i' continuation bytes
+        mask = (1 << 6 * i) - 1
+        if first & ~mask != last & ~mask:
+            if first & mask:
+                return first | mask
+            if last & mask != mask:
+                return (last & ~mask) - 1
+    return None
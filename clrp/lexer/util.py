@@ -1,8 +1,56 @@
+import sys
+import threading
+import weakref
+from array import array
+from bisect import bisect_right
+
+
+def merge_intervals(intervals):
+    # sort (first, last) ranges and merge the ones that overlap or touch
+    merged = []
+    for first, last in sorted(intervals):
+        if merged and first <= merged[-1][1] + 1:
+            if last > merged[-1][1]:
+                merged[-1] = (merged[-1][0], last)
+        else:
+            merged.append((first, last))
+    return tuple(merged)
+
+
+def complement_intervals(intervals, last):
+    # the ranges from 0 up to 'last' that none of 'intervals' cover
+    gaps = []
+    first = 0
+    for start, end in merge_intervals(intervals):
+        if start > first:
+            gaps.append((first, min(start - 1, last)))
+        first = max(first, end + 1)
+        if first > last:
+            break
+    if first <= last:
+        gaps.append((first, last))
+    return tuple(gap for gap in gaps if gap[0] <= gap[1])
+
+
+def positions(mask):
+    # the positions whose bits are set in 'mask'
+    found = []
+    while mask:
+        low = mask & -mask
+        found.append(low.bit_length() - 1)
+        mask ^= low
+    return found
+
+
+class TooManyStates(Exception):
+    """A DFA went over its budget of states"""
+
+
 class State:
     """A state in the DFA"""
 
     def __init__(self, composition, state_id):
-        # the nfa states this state is composed of
+        # the nfa states this state is composed of, as a bitmask
         # note that the nfa is not explicitly built
         self.composition = composition
         self.state_id = state_id
@@ -10,24 +58,365 @@ class State:
 
     def __eq__(self, other):
         return self.composition == other.composition
-    
+
+    def __hash__(self):
+        return hash(self.composition)
+
     def __lt__(self, other):
         # so that we can sort the list of states
         return self.state_id < other.state_id
 
     def dump(self):
-        dump = f"state {self.composition}:\n----------------\n"
+        dump = f"state {positions(self.composition)}:\n----------------\n"
         for letter, to_state in self.transitions.items():
-            dump += f"goto state {to_state.composition} upon '{letter}'\n"
+            dump += f"goto state {positions(to_state.composition)} upon '{letter}'\n"
         return dump
 
 
+class DFA:
+    """A compiled DFA"""
+
+    # the dead state; every transition out of it loops back to it
+    DEAD = 0
+    # a transition that hasn't been built yet (only in a LazyDFA)
+    UNKNOWN = -1
+    # how often the states were thrown away and numbered anew
+    # (only ever by a LazyDFA)
+    flushes = 0
+
+    def __init__(self, table, accept, start, n_classes, tags=None,
+                 stops=None):
+        # a flat transition table indexed by 'state * n_classes + class'
+        self.table = table
+        # the accept bitmap: 'accept[state]' is nonzero if it accepts
+        self.accept = accept
+        self.start = start
+        self.n_classes = n_classes
+        # which patterns every state accepts, as a bitmask of their
+        # ids (only kept for a RegexSet)
+        self.tags = tags
+        # which states an anchored match can stop at (see 'stop_states')
+        self.stops = stops
+
+    @property
+    def n_states(self):
+        return len(self.accept)
+
+    @property
+    def nbytes(self):
+        # roughly the memory the tables take up
+        return len(self.table) * self.table.itemsize + len(self.accept)
+
+    @classmethod
+    def from_states(cls, states, initial_state, finals, n_classes, tags=None):
+        # the state graph is numbered from 1 up, leaving 0 for DEAD;
+        # a state accepts if it has any of the 'finals' positions
+        ids = {id(state): i for i, state in enumerate(states, 1)}
+        table = array("i", [cls.DEAD]) * ((len(states) + 1) * n_classes)
+        accept = bytearray(len(states) + 1)
+        state_tags = [0] * (len(states) + 1) if tags else None
+        for state in states:
+            i = ids[id(state)]
+            accept[i] = bool(state.composition & finals)
+            if tags:
+                state_tags[i] = tags(state.composition)
+            for letter_class, to_state in state.transitions.items():
+                table[i * n_classes + letter_class] = ids[id(to_state)]
+        return cls(table, bytes(accept), ids[id(initial_state)], n_classes,
+                   tags=state_tags)
+
+    @classmethod
+    def build(cls, initial, dead, step, accepts, n_classes, tags=None,
+              max_states=None):
+        # the subset construction over any kind of hashable state;
+        # 'step(state, class)' gives the next state, and 'dead'
+        # is the state that never goes anywhere
+        keys = [dead, initial]
+        ids = {dead: cls.DEAD, initial: 1}
+        table = array("i")
+        # 'keys' grows as new states are found
+        for key in keys:
+            for letter_class in range(n_classes):
+                to_key = step(key, letter_class)
+                to_state = ids.get(to_key)
+                if to_state is None:
+                    if max_states is not None and len(keys) >= max_states:
+                        raise TooManyStates(len(keys))
+                    to_state = ids[to_key] = len(keys)
+                    keys.append(to_key)
+                table.append(to_state)
+        accept = bytes(bool(accepts(key)) for key in keys)
+        state_tags = [tags(key) for key in keys] if tags else None
+        return cls(table, accept, 1, n_classes, state_tags)
+
+    def stop_states(self, columns=None):
+        # where a match can stop without reading the rest of the input:
+        # 1 for the states that can never accept again (DEAD, and any
+        # state it's all rejecting from), 2 for the states that accept
+        # whatever comes after them; worked out once, upon first use.
+        # 'columns' are the classes that any character is in (all of
+        # them by default)
+        if self.stops is not None:
+            return self.stops
+        table, n = self.table, self.n_classes
+        columns = range(n) if columns is None else columns
+        previous = [[] for _ in range(self.n_states)]
+        for state in range(self.n_states):
+            for to_state in {table[state * n + cls] for cls in columns}:
+                previous[to_state].append(state)
+        # the states an accepting state can be reached from
+        live = [state for state in range(self.n_states) if self.accept[state]]
+        reached = set(live)
+        for state in live:
+            for from_state in previous[state]:
+                if from_state not in reached:
+                    reached.add(from_state)
+                    live.append(from_state)
+        # an accepting state accepts everything unless it can get
+        # to a state that doesn't accept
+        rejecting = [state for state in range(self.n_states)
+                     if not self.accept[state]]
+        failed = set(rejecting)
+        for state in rejecting:
+            for from_state in previous[state]:
+                if from_state not in failed:
+                    failed.add(from_state)
+                    rejecting.append(from_state)
+        stops = bytearray(self.n_states)
+        for state in range(self.n_states):
+            if state not in reached:
+                stops[state] = 1
+            elif state not in failed:
+                stops[state] = 2
+        self.stops = bytes(stops)
+        return self.stops
+
+    def by_bytes(self, byte_classes):
+        # the same dfa, with a column for every byte value instead of
+        # every class ('byte_classes[byte]' is the class of 'byte')
+        n = self.n_classes
+        rows = range(self.n_states)
+        table = array("i", (self.table[state * n + cls]
+                            for state in rows for cls in byte_classes))
+        return DFA(table, self.accept, self.start, len(byte_classes),
+                   self.tags, self.stops)
+
+    def dump(self, letters):
+        # 'letters[i]' lists the letters in class i
+        dump = ""
+        for state in range(1, self.n_states):
+            accepts = " (accepting)" if self.accept[state] else ""
+            dump += f"state {state}{accepts}:\n----------------\n"
+            row = state * self.n_classes
+            for i in range(self.n_classes):
+                to_state = self.table[row + i]
+                if to_state > self.DEAD:
+                    for letter in letters[i]:
+                        dump += f"goto state {to_state} upon '{letter}'\n"
+            dump += "\n"
+        return dump[:-2]
+
+
+class LazyCache:
+    """The states a LazyDFA built in one thread"""
+
+    def __init__(self, tagged):
+        self.table = array("i")
+        self.accept = bytearray()
+        self.tags = [] if tagged else None
+        self.keys = []
+        self.ids = {}
+        self.used = 0
+        self.flushes = 0
+
+
+class LazyDFA(DFA):
+    """A DFA whose states are built the first time they're reached"""
+
+    # every thread builds its states in a cache of its own: a flush
+    # renumbers the states, which would pull them out from under
+    # another thread in the middle of a match
+
+    def __init__(self, initial, dead, step, accepts, n_classes, cache_size,
+                 tags=None):
+        # 'initial', 'dead', 'step', 'accepts' and 'tags' are as in 'DFA.build'
+        self.start = 1
+        self.n_classes = n_classes
+        self.stops = None
+        self.tag = tags
+        self.initial = initial
+        self.dead = dead
+        self.step = step
+        self.accepts = accepts
+        self.cache_size = cache_size
+        self.local = threading.local()
+        self.caches = weakref.WeakSet()
+
+    @property
+    def cache(self):
+        cache = getattr(self.local, "cache", None)
+        if cache is None:
+            cache = self.local.cache = LazyCache(self.tag is not None)
+            self.caches.add(cache)
+            self.fill(cache)
+        return cache
+
+    # the matching loops take these once, and then only
+    # ever use them from the same thread
+    @property
+    def table(self):
+        return self.cache.table
+
+    @property
+    def accept(self):
+        return self.cache.accept
+
+    @property
+    def tags(self):
+        return self.cache.tags
+
+    @property
+    def flushes(self):
+        return self.cache.flushes
+
+    @property
+    def nbytes(self):
+        # each thread's cache may grow up to the cache size before
+        # it's flushed
+        return sum(max(self.cache_size, cache.used)
+                   for cache in list(self.caches)) or self.cache_size
+
+    def fill(self, cache):
+        # the table and accept bitmap are cleared in place,
+        # since the matching loops hold on to them
+        del cache.table[:]
+        del cache.accept[:]
+        if cache.tags is not None:
+            del cache.tags[:]
+        cache.keys = []
+        cache.ids = {}
+        cache.used = 0
+        # the dead state loops back to itself upon every class
+        self.add(cache, self.dead)
+        cache.table[:] = array("i", [self.DEAD]) * self.n_classes
+        self.add(cache, self.initial)
+
+    def add(self, cache, key):
+        state = len(cache.keys)
+        cache.keys.append(key)
+        cache.ids[key] = state
+        cache.table.extend(array("i", [self.UNKNOWN]) * self.n_classes)
+        cache.accept.append(bool(self.accepts(key)))
+        if cache.tags is not None:
+            cache.tags.append(self.tag(key))
+        # a rough estimate of the memory the state takes up
+        cache.used += (self.n_classes * cache.table.itemsize +
+                       sys.getsizeof(key))
+        return state
+
+    def transition(self, state, letter_class):
+        cache = self.cache
+        to_key = self.step(cache.keys[state], letter_class)
+        to_state = cache.ids.get(to_key)
+        if to_state is None:
+            if cache.used >= self.cache_size:
+                # start over with only the dead and initial states; this
+                # invalidates 'state', so the transition isn't recorded
+                cache.flushes += 1
+                self.fill(cache)
+                to_state = cache.ids.get(to_key)
+                if to_state is None:
+                    to_state = self.add(cache, to_key)
+                return to_state
+            to_state = self.add(cache, to_key)
+        cache.table[state * self.n_classes + letter_class] = to_state
+        return to_state
+
+
+class ClassMap(dict):
+    """Maps code points to their character class, for use with str.translate"""
+
+    # the code points looked up up front, and how many more are
+    # remembered once looked up; the rest are looked up every time
+    TABLE = 256
+    MEMO = 2 ** 12
+
+    def __init__(self, bounds, segments):
+        super().__init__()
+        # 'segments[i]' is the class of the code points from
+        # 'bounds[i]' up to (not including) 'bounds[i + 1]'
+        self.bounds = bounds
+        self.segments = segments
+        self.n_classes = max(segments) + 1
+        for code_point in range(self.TABLE):
+            self[code_point] = self.lookup(code_point)
+
+    def lookup(self, code_point):
+        return self.segments[bisect_right(self.bounds, code_point) - 1]
+
+    def __missing__(self, key):
+        cls = self.lookup(key)
+        if len(self) < self.TABLE + self.MEMO:
+            self[key] = cls
+        return cls
+
+    @property
+    def nbytes(self):
+        # roughly: the dict, and an int object for every key
+        return sys.getsizeof(self) + len(self) * sys.getsizeof(sys.maxunicode)
+
+    def classify(self, string):
+        # map every character to its class in one pass
+        classes = string.translate(self)
+        if self.n_classes <= 256:
+            return classes.encode("latin-1")
+        return array("i", map(ord, classes))
+
+
+class Span(tuple):
+    """The span of a match, which also gives the spans of its groups"""
+
+    def __new__(cls, span, groups=()):
+        self = super().__new__(cls, span)
+        self.groups = groups
+        return self
+
+    def __call__(self, i=0):
+        # the span of group 'i' (0 is the whole match), or
+        # (-1, -1) if it didn't take part in the match
+        if i == 0:
+            return tuple(self)
+        if not 0 < i <= len(self.groups):
+            raise IndexError(f"no such group {i}")
+        return self.groups[i - 1] or (-1, -1)
+
+
 class Match:
     """A regex match"""
 
-    def __init__(self, span, match):
-        self.span = span
-        self.match = match
-    
+    def __init__(self, span, match=None, pattern=None, string=None, groups=()):
+        # 'span(i)' gives the span of group 'i'
+        self.span = Span(span, groups)
+        # the id of the pattern that matched (only set by a RegexSet)
+        self.pattern = pattern
+        # without 'match', the text is sliced out of 'string' (which
+        # may be a memoryview or an mmap) once it's asked for
+        self.string = string
+        self.text = match
+
+    @property
+    def match(self):
+        if self.text is None:
+            self.text = self.string[self.span[0]: self.span[1]]
+        return self.text
+
+    def group(self, i=0):
+        # the text of group 'i' (0 is the whole match), or None if
+        # it didn't take part in the match
+        first, last = self.span(i)
+        if first < 0:
+            return None
+        return self.match[first - self.span[0]: last - self.span[0]]
+
     def __repr__(self):
         return f"<regex.Match <span={self.span}, match=\"{self.match}\">>"
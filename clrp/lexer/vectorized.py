@@ -0,0 +1,102 @@
+# numpy is only needed for matching whole arrays of strings at once
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# once no more than this many strings are still going, they're
+# finished one at a time
+FEW = 64
+
+
+def require_numpy():
+    if numpy is None:
+        raise ImportError("numpy is required to match arrays of strings")
+
+
+def encode(regex, strings):
+    # the classes of all the strings one after the other, and where each
+    # string starts in them and how long it is, sorted from the longest
+    # string down so that the strings still going at any column are
+    # always the first ones; also gives the order
+    if regex.binary:
+        strings = [bytes(string) for string in strings]
+        flat = numpy.frombuffer(b"".join(strings), dtype=numpy.uint8)
+    else:
+        strings = list(strings)
+        classes = regex.classify("".join(strings))
+        dtype = numpy.uint8 if isinstance(classes, bytes) else numpy.int32
+        flat = numpy.frombuffer(classes, dtype=dtype)
+    lengths = numpy.fromiter(map(len, strings), dtype=numpy.int64,
+                             count=len(strings))
+    order = numpy.argsort(-lengths, kind="stable")
+    offsets = numpy.concatenate(([0], numpy.cumsum(lengths)[:-1]))
+    return flat, offsets[order].astype(numpy.int64), lengths[order], order
+
+
+def finish(dfa, flat, offsets, lengths, states, rows, column):
+    # the rest of the first 'rows' strings from 'column' on, one at a
+    # time, which is quicker than a gather per column for only a few
+    table, n = dfa.table, dfa.n_classes
+    for row in range(rows):
+        state = int(states[row])
+        first = offsets[row] + column
+        for cls in flat[first: offsets[row] + lengths[row]].tolist():
+            state = table[state * n + cls]
+            if state == dfa.DEAD:
+                break
+        states[row] = state
+
+
+def final_states(regex, strings):
+    # the state of the anchored dfa at the end of every string, advancing
+    # all of them one column at a time with gathers from the table; each
+    # column is gathered from the classes as it's needed, so the memory
+    # stays proportional to the total length, however long the longest
+    # string is
+    require_numpy()
+    dfa = regex.dfa
+    table = numpy.frombuffer(dfa.table, dtype=numpy.int32)
+    flat, offsets, lengths, order = encode(regex, strings)
+    states = numpy.full(len(lengths), dfa.start, dtype=numpy.int64)
+    width = int(lengths[0]) if len(lengths) else 0
+    # how many strings are longer than each column
+    going = numpy.searchsorted(-lengths, -numpy.arange(width), side="left")
+    for column in range(width):
+        rows = going[column]
+        if rows <= FEW:
+            finish(dfa, flat, offsets, lengths, states, rows, column)
+            break
+        live = states[:rows]
+        live[:] = table[live * dfa.n_classes + flat[offsets[:rows] + column]]
+        if not live.any():
+            # every string still going is in the dead state
+            break
+    unsorted = numpy.empty_like(states)
+    unsorted[order] = states
+    return unsorted
+
+
+def check_array(regex, strings):
+    # 'check' for every string, as a boolean array
+    require_numpy()
+    if regex.literals is not None or regex.lazy or regex.dfa is None:
+        # no complete table to gather from
+        return numpy.fromiter((bool(regex.check(string)) for string in strings),
+                              dtype=bool)
+    accept = numpy.frombuffer(bytes(regex.dfa.accept), dtype=numpy.uint8)
+    return accept[final_states(regex, strings)].astype(bool)
+
+
+def fullmatch_array(regex, strings):
+    # the span of every string's full match, or (-1, -1)
+    require_numpy()
+    strings = list(strings)
+    matched = check_array(regex, strings)
+    lengths = numpy.fromiter(map(len, strings), dtype=numpy.int64,
+                             count=len(strings))
+    spans = numpy.full((len(strings), 2), -1, dtype=numpy.int64)
+    spans[matched, 0] = 0
+    spans[matched, 1] = lengths[matched]
+    return spans
@@ -0,0 +1,120 @@
+import threading
+import time
+import clrp
+from clrp.lexer import cache
+
+
+def test_lru_order():
+    patterns = clrp.PatternCache(max_size=2)
+    first = patterns.compile("ab")
+    patterns.compile("cd")
+    # 'ab' is used again, so 'cd' is the one to go
+    assert patterns.compile("ab") is first
+    patterns.compile("ef")
+    assert len(patterns) == 2
+    assert patterns.compile("ab") is first
+    assert (patterns.hits, patterns.misses, patterns.evictions) == (2, 3, 1)
+    patterns.compile("cd")
+    assert (patterns.hits, patterns.misses, patterns.evictions) == (2, 4, 2)
+
+
+def test_flags_are_part_of_the_key():
+    patterns = clrp.PatternCache()
+    assert patterns.compile("a+") is not patterns.compile("a+", lazy=True)
+    assert patterns.compile("a+") is not patterns.compile(b"a+")
+    assert patterns.compile("a+", lazy=True) is patterns.compile("a+",
+                                                                  lazy=True)
+    assert len(patterns) == 3
+
+
+def test_max_bytes():
+    nbytes = clrp.RegularExpression("[0-9]+x").nbytes
+    patterns = clrp.PatternCache(max_bytes=2 * nbytes)
+    for pattern in ["[0-9]+x", "[0-9]+y", "[0-9]+z"]:
+        patterns.compile(pattern)
+    assert len(patterns) == 2
+    assert patterns.nbytes <= patterns.max_bytes
+    assert patterns.evictions == 1
+    # a pattern bigger than the whole budget is compiled, but not kept
+    small = clrp.PatternCache(max_bytes=1)
+    regex = small.compile("[0-9]+x")
+    assert regex.check("12x")
+    assert len(small) == 0 and small.nbytes == 0
+
+
+def gated(monkeypatch, error=None):
+    # makes every compilation wait for the event it gives back,
+    # counting how many were started
+    gate = threading.Event()
+    calls = []
+    compile_regex = cache.RegularExpression
+
+    def compile_gated(pattern, **flags):
+        calls.append(pattern)
+        gate.wait()
+        if error is not None:
+            raise error
+        return compile_regex(pattern, **flags)
+    monkeypatch.setattr(cache, "RegularExpression", compile_gated)
+    return gate, calls
+
+
+def compile_in_threads(patterns, pattern, n):
+    # 'patterns.compile(pattern)' in 'n' threads; 'results' gets what
+    # each of them got back (or raised) once they're joined
+    results = [None] * n
+
+    def run(i):
+        try:
+            results[i] = patterns.compile(pattern)
+        except Exception as error:
+            results[i] = error
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def wait_for(condition):
+    # until every thread has asked for the pattern
+    for _ in range(1000):
+        if condition():
+            return
+        time.sleep(0.01)
+    assert False, "the threads never got there"
+
+
+def test_single_flight(monkeypatch):
+    gate, calls = gated(monkeypatch)
+    patterns = clrp.PatternCache()
+    threads, results = compile_in_threads(patterns, "[0-9]+", 8)
+    wait_for(lambda: patterns.hits + patterns.misses == 8)
+    gate.set()
+    for thread in threads:
+        thread.join()
+    assert calls == ["[0-9]+"]
+    assert all(result is results[0] for result in results)
+    assert results[0].check("123")
+    assert (patterns.hits, patterns.misses) == (7, 1)
+    assert len(patterns) == 1
+
+
+def test_error_reaches_every_waiter(monkeypatch):
+    gate, calls = gated(monkeypatch, ValueError("bad pattern"))
+    patterns = clrp.PatternCache()
+    threads, results = compile_in_threads(patterns, "a", 4)
+    wait_for(lambda: patterns.hits + patterns.misses == 4)
+    gate.set()
+    for thread in threads:
+        thread.join()
+    assert calls == ["a"]
+    assert all(isinstance(result, ValueError) for result in results)
+    # nothing was kept, and the next call tries again
+    assert len(patterns) == 0 and not patterns.pending
+    try:
+        patterns.compile("a")
+    except ValueError:
+        pass
+    else:
+        assert False, "the error was kept back"
+    assert calls == ["a", "a"]
@@ -0,0 +1,46 @@
+import clrp
+from test_regex import PATTERNS, STRINGS
+
+
+def spans(matches):
+    return [tuple(m.span) for m in matches]
+
+
+def test_specialize():
+    # the generated matcher has to agree with the tables it's made from
+    for pattern in PATTERNS:
+        for binary in (False, True):
+            regex = clrp.RegularExpression(
+                pattern.encode() if binary else pattern, aho_corasick=False)
+            matcher = regex.specialize()
+            for string in STRINGS + [string[1:-1] for string in STRINGS]:
+                if binary:
+                    string = string.encode()
+                assert spans(matcher.findall(string)) == spans(
+                    regex.findall(string)), (pattern, string)
+                assert matcher.check(string) == regex.check(string)
+                assert matcher.endswith(string) == regex.endswith(string)
+
+
+def test_codegen(tmp_path):
+    regex = clrp.RegularExpression("[0-9]+x")
+    path = tmp_path / "matcher.py"
+    regex.codegen(str(path))
+    matcher = {}
+    exec(compile(path.read_text(), str(path), "exec"), matcher)
+    assert spans(matcher["findall"]("12x 4 55x")) == [(0, 3), (6, 9)]
+    assert matcher["check"]("123x") and not matcher["check"]("123")
+
+
+def test_no_dfa():
+    for flags in [{"lazy": True}, {"max_states": 1}, {}]:
+        regex = clrp.RegularExpression("foo|bar", **flags)
+        if not flags:
+            # aho-corasick takes this one
+            assert regex.literals is not None
+        try:
+            regex.specialize()
+        except ValueError:
+            pass
+        else:
+            assert False, flags
@@ -0,0 +1,49 @@
+import re
+import clrp
+from test_regex import PATTERNS, STRINGS, FLAGS
+
+
+def same_groups(pattern, string, matches):
+    # every group is checked against re run on the match alone
+    for m in matches:
+        first, last = m.span
+        expected = re.fullmatch(pattern, string[first:last], re.S)
+        for i in range(1, expected.re.groups + 1):
+            if expected.span(i) == (-1, -1):
+                assert m.span(i) == (-1, -1)
+                assert m.group(i) is None
+            else:
+                start, end = expected.span(i)
+                assert m.span(i) == (start + first, end + first)
+                assert m.group(i) == expected.group(i)
+
+
+def test_groups():
+    for pattern in PATTERNS:
+        for flags in FLAGS:
+            regex = clrp.RegularExpression(pattern, **flags)
+            for string in STRINGS:
+                same_groups(pattern, string, regex.findall(string))
+
+
+def test_stream_groups():
+    # the groups of a stream's matches are offsets in the whole input
+    string = "".join(STRINGS)
+    for pattern in PATTERNS:
+        stream = clrp.Stream(clrp.RegularExpression(pattern))
+        matches = []
+        for first in range(0, len(string), 4):
+            matches += stream.feed(string[first:first + 4])
+        matches += stream.close()
+        same_groups(pattern, string, matches)
+
+
+def test_no_such_group():
+    match, = clrp.RegularExpression("(a)b").findall("ab")
+    assert match.span(1) == (0, 1)
+    try:
+        match.span(2)
+    except IndexError:
+        pass
+    else:
+        assert False, "there's only one group"
@@ -0,0 +1,56 @@
+import clrp
+from clrp.lexer import parallel
+from test_regex import PATTERNS, STRINGS
+
+
+def found(matches):
+    return [(tuple(m.span), m.span.groups, m.pattern) for m in matches]
+
+
+def counted(monkeypatch):
+    # how many matches the usual search had to find while it
+    # wasn't in step with a chunk
+    caught_up = []
+    sequential = parallel.sequential
+
+    def counting(*args):
+        for match in sequential(*args):
+            caught_up.append(match)
+            yield match
+    monkeypatch.setattr(parallel, "sequential", counting)
+    return caught_up
+
+
+def test_finditer(monkeypatch):
+    caught_up = counted(monkeypatch)
+    string = "".join(STRINGS) * 8
+    total = 0
+    for pattern in PATTERNS + ["a(b|c)*", "(a)(b)?c*"]:
+        for flags in [{}, {"aho_corasick": False}, {"lazy": True}]:
+            regex = clrp.RegularExpression(pattern, **flags)
+            expected = found(regex.findall(string))
+            total += len(expected)
+            for executor in ["serial", "thread"]:
+                for chunk_size, overlap in [(3, 1), (7, 0), (64, 4)]:
+                    assert found(regex.findall_parallel(
+                        string, executor, 2, chunk_size, overlap)) == expected
+    # both the chunks' matches and the catch-up search were used
+    assert 0 < len(caught_up) < 6 * total
+
+
+def test_regex_set():
+    regex = clrp.RegexSet(["ab", "b+", "c"])
+    string = "abbbcab" * 50
+    assert found(regex.findall_parallel(string, "serial", chunk_size=5,
+                                        overlap=1)) == found(
+        regex.findall(string))
+
+
+def test_check():
+    string = "1234567890" * 100
+    for pattern in ["[0-9]+", "([0-9][0-9])+", "[0-9]*5"]:
+        regex = clrp.RegularExpression(pattern)
+        for text in [string, string + "x", "x" + string]:
+            for executor in ["serial", "thread"]:
+                assert regex.check_parallel(text, executor, 3,
+                                            chunk_size=7) == regex.check(text)
@@ -1,4 +1,189 @@
-import clrp
-
-regex = clrp.RegularExpression(r"[0-9]+")
-print(regex.check("868993458990966743234"))
+import re
+import clrp
+from clrp.lexer.parser.parser import ParseError
+
+# none of these match the empty string, which 'findall' never gives
+PATTERNS = [
+    "[0-9]+",
+    "ab|bcde",
+    "abcd|c",
+    "a|a*b",
+    "(a|b)*c",
+    "a(b|c)*d?",
+    "[^ab ]+",
+    "x.y",
+    "(a+)(b|(c))d",
+    "(ab)?(a|b)+",
+    "foo|fob|o",
+]
+
+STRINGS = [
+    "",
+    "a",
+    "aab",
+    "abcde",
+    "bcdabcbd",
+    "xaabdacd",
+    "ab12 ba9 c",
+    "xzy x\ny foo fob",
+    "aaabbbcccdddabcabd" * 3,
+]
+
+# the ways a pattern can be run, which all have to agree
+FLAGS = [{}, {"lazy": True}, {"max_states": 1}, {"aho_corasick": False}]
+
+
+def longest_matches(pattern, string):
+    # the leftmost-longest spans of 'pattern' in 'string', found with re
+    # by trying every span, starting over after each of them
+    compiled = re.compile(pattern, re.S)
+    spans = []
+    pos = 0
+    while pos < len(string):
+        for start in range(pos, len(string)):
+            ends = [end for end in range(len(string), start, -1)
+                    if compiled.fullmatch(string, start, end)]
+            if ends:
+                spans.append((start, ends[0]))
+                pos = ends[0]
+                break
+        else:
+            break
+    return spans
+
+
+def test_findall():
+    for pattern in PATTERNS:
+        for flags in FLAGS:
+            regex = clrp.RegularExpression(pattern, **flags)
+            for string in STRINGS:
+                spans = [tuple(m.span) for m in regex.findall(string)]
+                assert spans == longest_matches(pattern, string), (pattern,
+                                                                   flags)
+
+
+def test_check():
+    for pattern in PATTERNS:
+        for flags in FLAGS:
+            regex = clrp.RegularExpression(pattern, **flags)
+            for string in STRINGS + longest_strings(pattern):
+                expected = re.fullmatch(pattern, string, re.S) is not None
+                assert regex.check(string) == expected, (pattern, string)
+
+
+def longest_strings(pattern):
+    # the matches themselves, so that 'check' also sees some it accepts
+    return [string[first:last] for string in STRINGS
+            for first, last in longest_matches(pattern, string)]
+
+
+def test_overlapping_start():
+    # the match starts inside a failed attempt at one
+    for flags in FLAGS:
+        regex = clrp.RegularExpression("ab", **flags)
+        assert [tuple(m.span) for m in regex.findall("aab")] == [(1, 3)]
+        assert regex.findall("aab")[0].match == "ab"
+
+
+def test_fullmatch():
+    for pattern, string in [("ab", "ab"), ("[0-9]+", "2024"),
+                            ("(a+)(b|(c))d", "aacd")]:
+        regex = clrp.RegularExpression(pattern)
+        match, = regex.fullmatch(string)
+        assert tuple(match.span) == (0, len(string))
+        assert match.match == string
+        assert regex.fullmatch(string + "x") is None
+    assert clrp.RegularExpression("[0-9]+").fullmatch("") is None
+    match, = clrp.RegularExpression("(a+)(b|(c))d").fullmatch("aacd")
+    assert match.group(1) == "aa" and match.group(3) == "c"
+
+
+def first_match(pattern, string):
+    # the match that ends first, and the longest one ending there
+    compiled = re.compile(pattern, re.S)
+    for end in range(1, len(string) + 1):
+        for start in range(end):
+            if compiled.fullmatch(string, start, end):
+                return start, end
+    return None
+
+
+def test_search():
+    for pattern in PATTERNS:
+        for flags in FLAGS:
+            regex = clrp.RegularExpression(pattern, **flags)
+            for string in STRINGS:
+                expected = first_match(pattern, string)
+                match = regex.search(string)
+                assert (match and tuple(match.span)) == expected, (
+                    pattern, flags, string)
+                assert regex.is_match(string) == (expected is not None)
+
+
+def test_check_stops_early():
+    # once '[ab].*' has read its first character, nothing after it can
+    # change the answer, so the rest is never even classified
+    regex = clrp.RegularExpression("[ab].*")
+    dfa = regex.dfa
+    stops = dfa.stop_states()
+    after = dfa.table[dfa.start * dfa.n_classes + regex.classify("a")[0]]
+    assert stops[dfa.start] == 0 and stops[after] == 2
+    assert regex.check("a" + "x" * 100000) is True
+    assert classified(regex, "a" + "x" * 100000) < 100000
+    # and so does a string that has already failed
+    regex = clrp.RegularExpression("[ab]c.*")
+    assert regex.check("ax" + "c" * 100000) is False
+    assert classified(regex, "ax" + "c" * 100000) < 100000
+
+
+def classified(regex, string):
+    # how many characters 'check' classified before it answered
+    lengths = []
+    classify = regex.classify
+    regex.classify = lambda text: lengths.append(len(text)) or classify(text)
+    regex.check(string)
+    del regex.classify
+    return sum(lengths)
+
+
+def test_literal_alternatives():
+    # aho-corasick takes these, but they look like any other pattern
+    for regex in [clrp.RegularExpression("foo|bar|o"),
+                  clrp.RegularExpression.from_bytes(
+                      clrp.RegularExpression("foo|bar|o").to_bytes())]:
+        assert regex.literals is not None
+        assert regex.dfa is None and regex.reverse_dfa is None
+        assert not regex.searches
+        assert regex.prefix == regex.factor == ""
+        assert [tuple(m.span) for m in regex.findall("fooxbaro")] == [
+            (0, 3), (4, 7), (7, 8)]
+        assert regex.check("bar") and not regex.check("ba")
+
+
+def test_regex_set():
+    regex = clrp.RegexSet(["ab", "b+", "c"])
+    assert [(tuple(m.span), m.pattern) for m in regex.findall("abbbcab")] == [
+        ((0, 2), 0), ((2, 4), 1), ((4, 5), 2), ((5, 7), 0)]
+    # a single pattern isn't a list of patterns, one for every character
+    for patterns in ["ab", b"ab"]:
+        try:
+            clrp.RegexSet(patterns)
+        except TypeError:
+            pass
+        else:
+            assert False, patterns
+
+
+def test_trailing_escape():
+    # the escape is left to the parser, which has nothing to escape
+    try:
+        clrp.RegularExpression("ab\\")
+    except ParseError:
+        pass
+    else:
+        assert False, "a trailing escape isn't a pattern"
+
+
+if __name__ == "__main__":
+    regex = clrp.RegularExpression(r"[0-9]+")
+    print(regex.check("868993458990966743234"))
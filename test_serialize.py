@@ -0,0 +1,48 @@
+import clrp
+from test_regex import PATTERNS, STRINGS
+
+
+def test_to_bytes():
+    for pattern in PATTERNS:
+        # (a pattern run by the vm has no automata to save)
+        for flags in [{}, {"aho_corasick": False}]:
+            regex = clrp.RegularExpression(pattern, **flags)
+            loaded = clrp.RegularExpression.from_bytes(regex.to_bytes())
+            assert loaded.to_bytes() == regex.to_bytes()
+            for string in STRINGS:
+                assert same_matches(loaded, regex, string)
+                assert loaded.check(string) == regex.check(string)
+    regex = clrp.RegularExpression(b"[0-9]+|ab")
+    loaded = clrp.RegularExpression.from_bytes(regex.to_bytes())
+    assert same_matches(loaded, regex, b"x12ab 3")
+    regex = clrp.RegexSet(PATTERNS[:4])
+    loaded = clrp.RegexSet.from_bytes(regex.to_bytes())
+    assert loaded.to_bytes() == regex.to_bytes()
+    for string in STRINGS:
+        assert same_matches(loaded, regex, string)
+
+
+def same_matches(first, second, string):
+    return ([(tuple(m.span), m.pattern) for m in first.findall(string)] ==
+            [(tuple(m.span), m.pattern) for m in second.findall(string)])
+
+
+def test_load(tmp_path):
+    # the tables are used straight out of the mapped file
+    regex = clrp.RegularExpression("(a|b)*c[0-9]+")
+    path = tmp_path / "regex.clrp"
+    regex.dump(str(path))
+    loaded = clrp.RegularExpression.load(str(path))
+    assert same_matches(loaded, regex, "abc12 c3 ac")
+    assert loaded.search("xbc1").span == (1, 4)
+
+
+def test_version():
+    data = bytearray(clrp.RegularExpression("a+").to_bytes())
+    data[4] += 1
+    try:
+        clrp.RegularExpression.from_bytes(data)
+    except ValueError:
+        pass
+    else:
+        assert False, "a format it doesn't know was loaded"
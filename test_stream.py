@@ -0,0 +1,41 @@
+import io
+import clrp
+from test_regex import PATTERNS, STRINGS
+
+
+def test_stream():
+    # the matches can't depend on where the input is cut up
+    string = "".join(STRINGS)
+    for pattern in PATTERNS:
+        regex = clrp.RegularExpression(pattern)
+        expected = [tuple(m.span) for m in regex.findall(string)]
+        for size in range(1, 6):
+            stream = clrp.Stream(regex)
+            matches = []
+            for first in range(0, len(string), size):
+                matches += stream.feed(string[first:first + size])
+            matches += stream.close()
+            assert [tuple(m.span) for m in matches] == expected, (pattern,
+                                                                  size)
+        stream = clrp.Stream(regex)
+        matches = stream.scan(io.StringIO(string), 7)
+        assert [tuple(m.span) for m in matches] == expected
+
+
+def test_stream_flushed():
+    # a lazy dfa used for something else between two chunks may throw
+    # away the states the stream was in
+    regex = clrp.RegularExpression("(a|b)*a(a|b)(a|b)(a|b)c", lazy=True,
+                                   cache_size=300)
+    other = "ab" * 100 + "aabba" * 20 + "c"
+    strings = ["aabaaaac", "babbbac" * 3, "abacabbbacaaaac", "aaaa" * 5 + "c"]
+    for string in strings:
+        expected = [tuple(m.span) for m in regex.findall(string)]
+        for cut in range(len(string) + 1):
+            stream = clrp.Stream(regex)
+            matches = stream.feed(string[:cut])
+            flushes = regex.dfa.flushes + regex.scan_dfa.flushes
+            regex.findall(other)
+            assert regex.dfa.flushes + regex.scan_dfa.flushes > flushes
+            matches += stream.feed(string[cut:]) + stream.close()
+            assert [tuple(m.span) for m in matches] == expected, (string, cut)
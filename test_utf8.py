@@ -0,0 +1,67 @@
+import clrp
+from clrp.lexer import utf8
+
+# one character of every encoded length, and both sides of every
+# boundary between them
+TEXT = "aé😀 αβ"
+EDGES = "\x7f\x80\u07ff\u0800\ud7ff\ue000\uffff\U00010000\U0010ffff"
+
+PATTERNS = [
+    ".",
+    ".+",
+    "[^a ]+",
+    "[^é]",
+    "[é-😀]+",
+    "[α-ω]+",
+    "é|😀",
+    "a(é|β)*",
+    "[\x7f-\x80]",
+    "[\u07ff-\u0800]+",
+    "[\ud7ff-\ue000]",
+    "[\uffff-\U00010000]",
+    "[^\x00-\U0010fffe]",
+]
+
+
+def byte_spans(string, spans):
+    # the str mode spans in the utf-8 encoding of 'string'
+    return [(len(string[:first].encode()), len(string[:last].encode()))
+            for first, last in spans]
+
+
+def test_findall():
+    # the same matches as the str pattern, in the encoded text
+    for pattern in PATTERNS:
+        regex = clrp.RegularExpression(pattern)
+        encoded = clrp.RegularExpression(pattern, utf8=True)
+        for string in [TEXT, EDGES, TEXT + EDGES + TEXT]:
+            spans = [tuple(m.span) for m in regex.findall(string)]
+            assert [tuple(m.span) for m in encoded.findall(
+                string.encode())] == byte_spans(string, spans), pattern
+
+
+def test_check():
+    for pattern in PATTERNS:
+        regex = clrp.RegularExpression(pattern)
+        encoded = clrp.RegularExpression(pattern, utf8=True, lazy=True)
+        for char in TEXT + EDGES:
+            assert encoded.check(char.encode()) == regex.check(char), (
+                pattern, char)
+
+
+def test_sequences():
+    # every code point but the surrogates is matched by exactly one
+    # sequence, and a surrogate by none
+    found = utf8.sequences([(0, 0x10FFFF)])
+    for code_point in [0, 0x7F, 0x80, 0x7FF, 0x800, 0xD7FF, 0xD800, 0xDFFF,
+                       0xE000, 0xFFFF, 0x10000, 0x3FFFF, 0x40000, 0x10FFFF]:
+        if 0xD800 <= code_point <= 0xDFFF:
+            encoded = b"\xed" + bytes([0x80 | code_point >> 6 & 0x3F,
+                                       0x80 | code_point & 0x3F])
+        else:
+            encoded = chr(code_point).encode()
+        matching = [ranges for ranges in found if len(ranges) == len(encoded)
+                    and all(first <= byte <= last
+                            for byte, (first, last) in zip(encoded, ranges))]
+        expected = 0 if 0xD800 <= code_point <= 0xDFFF else 1
+        assert len(matching) == expected, hex(code_point)
@@ -0,0 +1,52 @@
+import random
+import tracemalloc
+import pytest
+import clrp
+from clrp.lexer import vectorized
+from test_regex import PATTERNS, STRINGS
+
+numpy = pytest.importorskip("numpy")
+
+
+def random_strings(n, letters, longest):
+    rng = random.Random(0)
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(0, longest)))
+            for _ in range(n)]
+
+
+def test_check_array():
+    # enough strings that the columns are gathered for a while before
+    # the last few are finished one at a time
+    strings = STRINGS + random_strings(4 * vectorized.FEW, "abcdx0 ", 12)
+    for pattern in PATTERNS:
+        for flags in [{}, {"lazy": True}, {"max_states": 1}]:
+            regex = clrp.RegularExpression(pattern, **flags)
+            expected = [bool(regex.check(string)) for string in strings]
+            assert regex.check_array(strings).tolist() == expected, pattern
+        regex = clrp.RegularExpression(pattern.encode())
+        data = [string.encode() for string in strings]
+        assert regex.check_array(data).tolist() == [
+            bool(regex.check(string)) for string in data]
+
+
+def test_fullmatch_array():
+    regex = clrp.RegularExpression("[a-c]+x?")
+    spans = regex.fullmatch_array(["ab", "x", "", "abcx", "abxc"])
+    assert spans.tolist() == [[0, 2], [-1, -1], [-1, -1], [0, 4], [-1, -1]]
+    assert regex.check_array([]).tolist() == []
+
+
+def test_long_outlier():
+    # one long string among many short ones mustn't take memory for
+    # every string at every column
+    regex = clrp.RegularExpression("[a-c]+x?")
+    strings = random_strings(5000, "abcx", 12) + ["a" * 100000 + "x"]
+    tracemalloc.start()
+    try:
+        matched = regex.check_array(strings)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert matched.tolist() == [bool(regex.check(string))
+                                for string in strings]
+    assert peak < 2 ** 23